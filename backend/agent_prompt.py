@@ -0,0 +1,32 @@
+from typing import Sequence
+
+from langchain.agents.conversational_chat.output_parser import ConvoOutputParser
+from langchain.agents.conversational_chat.prompt import SUFFIX
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.tools import BaseTool
+
+_USER_INPUT = "USER'S INPUT"
+
+
+def build_agent_prompt(tools: Sequence[BaseTool]) -> ChatPromptTemplate:
+    """
+    The conversational ReAct agent's prompt, ordered so everything that doesn't
+    change between turns comes first: one system message with the persona
+    ({persona}), the tool descriptions and the response format, then the chat
+    history, then the question. Requests with the same assistant settings
+    share a byte-identical prefix that the provider can serve from its prompt
+    cache. LangChain's default layout repeats the tools and format
+    instructions after the history instead, so the prefix ended at the history.
+    """
+    # Rendered the way ConversationalChatAgent.create_prompt does, then split before the question
+    instructions = SUFFIX.format(format_instructions=ConvoOutputParser().get_format_instructions()).format(
+        tool_names=", ".join(tool.name for tool in tools),
+        tools="\n".join(f"> {tool.name}: {tool.description}" for tool in tools)
+    )
+    split = instructions.index(_USER_INPUT)
+    return ChatPromptTemplate.from_messages([
+        ("system", "{persona}\n\n" + instructions[:split].rstrip()),
+        MessagesPlaceholder(variable_name="chat_history"),
+        ("human", instructions[split:]),
+        MessagesPlaceholder(variable_name="agent_scratchpad")
+    ])
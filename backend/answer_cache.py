@@ -0,0 +1,110 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+
+class CachedAnswer:
+    def __init__(self, namespace: str, question: str, embedding: np.ndarray, answer: str):
+        self.namespace = namespace
+        self.question = question
+        self.embedding = embedding
+        self.answer = answer
+        self.created_at = time.time()
+
+
+class AnswerCache:
+    """
+    Opt-in cache of final answers. An entry is reused when a new question's
+    embedding is at least `similarity_threshold` cosine-similar to a cached
+    question asked against the same documents with the same system prompt.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.97, max_entries: int = 10000,
+                 ttl_seconds: float = 24 * 3600):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # entry id -> CachedAnswer, least recently used first
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._namespaces: Dict[str, Set[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def namespace(document_fingerprint: str, system_prompt: str) -> str:
+        """Answers are only shared between identical document sets and prompts"""
+        return hashlib.sha256(f"{document_fingerprint}\0{system_prompt}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, namespace: str, embedding: List[float]) -> Optional[str]:
+        """Return the answer to the most similar cached question above the threshold, if any"""
+        query = self._normalize(embedding)
+        with self._lock:
+            self._expire()
+            entry_ids = list(self._namespaces.get(namespace, ()))
+            best_id = None
+            if entry_ids:
+                matrix = np.stack([self._entries[entry_id].embedding for entry_id in entry_ids])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    best_id = entry_ids[best]
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id].answer
+
+    def store(self, namespace: str, question: str, embedding: List[float], answer: str):
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = CachedAnswer(namespace, question, self._normalize(embedding), answer)
+            self._namespaces.setdefault(namespace, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [entry_id for entry_id, entry in self._entries.items() if entry.created_at < cutoff]
+        for entry_id in expired:
+            self._remove(entry_id)
+        self.expirations += len(expired)
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        entry_ids = self._namespaces[entry.namespace]
+        entry_ids.discard(entry_id)
+        if not entry_ids:
+            del self._namespaces[entry.namespace]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "similarity_threshold": self.similarity_threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
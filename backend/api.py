@@ -1,29 +1,456 @@
+import logging
 import os
 import tempfile
-from typing import List, Dict
+import time
+from typing import AsyncIterator, Callable, List, Dict, Optional, Tuple
 import uuid
-import json
+import asyncio
+import functools
+import multiprocessing
+import shutil
+from itertools import islice
+from collections import defaultdict, deque
+from contextlib import aclosing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 
 # LangChain and OpenAI imports
-from langchain_community.document_loaders import PyPDFLoader 
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain.agents import initialize_agent, Tool, AgentType
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain.agents import AgentExecutor, AgentType, Tool
+from langchain.agents.conversational_chat.base import ConversationalChatAgent
+from langchain.agents.conversational_chat.output_parser import ConvoOutputParser
+from langchain.chains import LLMChain
+from langchain_openai import ChatOpenAI
 from langchain.memory import ConversationBufferMemory
-from langchain.schema import SystemMessage
+from langchain.schema import Document
 
+from agent_prompt import build_agent_prompt
+
+from answer_cache import AnswerCache
 from conversation_manager import ConversationManager
+from direct_answer import CHAT_MODES, DirectAnswerer
+from document_index import RETRIEVAL_MODES, DocumentIndex
+from ingestion import file_sha256, page_documents, parse_page_range, pdf_page_count, split_pages
+from jobs import FileProgress, IngestionJob, JobRegistry
+from llm_clients import ClientRegistry
+from page_cache import PageTextCache
+from reranking import Reranker, create_scorer
+from retrieval_cache import CachedRetriever, RetrievalStats, retrieval_stats
+from session_cache import SessionCache
+from shared_index import SharedVectorIndex
+from streaming import FinalAnswerStreamer, sse_event
+from telemetry import REQUEST_SECONDS, AgentTelemetry, RequestTimings, log_event, metrics, request_timings, span, start_timings
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+from embedding_providers import (
+    DEFAULT_EMBEDDING_MODELS, EMBEDDING_PROVIDERS, REMOTE_PROVIDERS, embedding_store_name
+)
+from embedding_scheduler import EmbeddingScheduler, ScheduledEmbeddings
 
 app = FastAPI(title="PDF Chatbot API")
+logger = logging.getLogger(__name__)
+# Share of requests and ingestion jobs whose steps (LLM calls, agent actions, timings) are logged as JSON lines
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+# Those lines go to stderr as bare JSON whatever the root logger is set up to do
+structured_log_handler = logging.StreamHandler()
+structured_log_handler.setFormatter(logging.Formatter("%(message)s"))
+logging.getLogger("telemetry").addHandler(structured_log_handler)
+logging.getLogger("telemetry").setLevel(logging.INFO)
+logging.getLogger("telemetry").propagate = False
+
+# Per-conversation state is bounded; anything evicted is reloaded from storage on the next request
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "256"))
+SESSION_CACHE_MAX_BYTES = int(os.getenv("SESSION_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+SESSION_CACHE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "1800"))
+
+# Past turns beyond the token budget are folded into a rolling summary written by this model
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "2000"))
+MEMORY_SUMMARY_MODEL = os.getenv("MEMORY_SUMMARY_MODEL", "gpt-4o-mini")
+# Model behind every conversation's agent and direct answers
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o")
+# Chat and embedding clients are shared by all conversations, as are their HTTP connection pools
+llm_clients = ClientRegistry(
+    max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+    max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20")),
+    keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+)
+# How Document Search ranks chunks unless a conversation overrides it: dense, lexical or hybrid
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# How questions are answered unless a request says otherwise: agent, direct or auto
+CHAT_MODE = os.getenv("CHAT_MODE", "agent")
+if CHAT_MODE not in CHAT_MODES:
+    raise ValueError(f"CHAT_MODE must be one of {', '.join(CHAT_MODES)}")
+# In auto mode, share of a question's content words the retrieved chunks must contain to skip the agent
+AUTO_MODE_MIN_COVERAGE = float(os.getenv("AUTO_MODE_MIN_COVERAGE", "0.75"))
+
+def get_summary_llm() -> ChatOpenAI:
+    return llm_clients.chat_model(MEMORY_SUMMARY_MODEL)
+
+def drop_agent(conversation_id: str, _):
+    """A chat session holds its conversation's index and memory, so it goes when either of them does"""
+    agents.pop(conversation_id, None)
+
+def drop_session(conversation_id: str, _):
+    document_indexes.pop(conversation_id, None)
+    conversation_manager.active_conversations.pop(conversation_id, None)
+
+def memory_size(memory: ConversationBufferMemory) -> int:
+    return sum(len(str(message.content)) for message in memory.chat_memory.messages)
 
 # Global variables
-conversation_manager = ConversationManager()
-vector_stores: Dict[str, FAISS] = {}
-agents: Dict[str, any] = {}
+agents = SessionCache(
+    max_entries=SESSION_CACHE_MAX_ENTRIES,
+    ttl_seconds=SESSION_CACHE_TTL_SECONDS,
+    on_evict=drop_session
+)
+document_indexes = SessionCache(
+    max_entries=SESSION_CACHE_MAX_ENTRIES,
+    max_bytes=SESSION_CACHE_MAX_BYTES,
+    ttl_seconds=SESSION_CACHE_TTL_SECONDS,
+    size_of=lambda document_index: document_index.memory_bytes(),
+    on_evict=drop_agent
+)
+conversation_manager = ConversationManager(
+    active_conversations=SessionCache(
+        max_entries=SESSION_CACHE_MAX_ENTRIES,
+        ttl_seconds=SESSION_CACHE_TTL_SECONDS,
+        size_of=memory_size,
+        on_evict=drop_agent
+    ),
+    default_settings={"memory_token_budget": MEMORY_TOKEN_BUDGET, "retrieval_mode": RETRIEVAL_MODE},
+    summarizer=get_summary_llm
+)
+index_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+job_registry = JobRegistry()
+ingestion_queue: "asyncio.Queue[IngestionJob]" = asyncio.Queue()
+background_tasks: List[asyncio.Task] = []
+
+# PDF parsing is CPU-bound and runs in separate processes; embedding calls and
+# index reads/writes are I/O-bound and run on threads
+INGESTION_PROCESSES = int(os.getenv("INGESTION_PROCESSES", str(os.cpu_count() or 1)))
+
+def new_parsing_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=INGESTION_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+
+parsing_pool = new_parsing_pool()
+io_pool = ThreadPoolExecutor(max_workers=int(os.getenv("INGESTION_THREADS", "8")))
+# PDFs are parsed, embedded and indexed in page ranges of this size; each
+# file keeps up to PARSE_AHEAD ranges in flight on the process pool
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "50"))
+PARSE_AHEAD = int(os.getenv("PDF_PARSE_AHEAD", str(INGESTION_PROCESSES)))
+# Uploads are copied to disk in blocks of this size
+UPLOAD_BLOCK_BYTES = 1024 * 1024
+
+# Opt-in: answers are reused for near-identical questions about the same documents
+answer_cache = None
+if os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true":
+    answer_cache = AnswerCache(
+        similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.97")),
+        max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000")),
+        ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+    )
+
+# Per-conversation memo of Document Search queries and results
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "256"))
+
+# Document Search over-fetches candidates, drops duplicates, re-ranks and packs
+# them into a token budget; a budget of 0 returns a fixed top 5 instead
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "1200"))
+reranker = None
+if RETRIEVAL_TOKEN_BUDGET > 0:
+    reranker = Reranker(
+        create_scorer(os.getenv("RERANKER", "lexical"), os.getenv("RERANKER_MODEL")),
+        fetch_k=int(os.getenv("RETRIEVAL_FETCH_K", "20")),
+        token_budget=RETRIEVAL_TOKEN_BUDGET,
+        max_results=int(os.getenv("RETRIEVAL_MAX_RESULTS", "8"))
+    )
+
+embedding_cache = EmbeddingCache(
+    os.path.join(conversation_manager.storage_dir, ".cache", "embeddings.sqlite"),
+    max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+)
+
+# Extracted page text by file hash, so reloads and duplicate uploads skip parsing
+page_cache = PageTextCache(
+    os.path.join(conversation_manager.storage_dir, ".cache", "pages.sqlite"),
+    max_files=int(os.getenv("PAGE_CACHE_MAX_FILES", "1000"))
+)
+
+# Where chunk and query embeddings come from: the OpenAI API or a local CPU model
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+if EMBEDDING_PROVIDER not in EMBEDDING_PROVIDERS:
+    raise ValueError(f"EMBEDDING_PROVIDER must be one of {', '.join(EMBEDDING_PROVIDERS)}, got {EMBEDDING_PROVIDER!r}")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL") or DEFAULT_EMBEDDING_MODELS[EMBEDDING_PROVIDER]
+
+# Every conversation's chunks live in one index per embedding model; conversations search only their own chunk IDs
+vector_index = SharedVectorIndex(
+    os.path.join(conversation_manager.storage_dir, ".index", embedding_store_name(EMBEDDING_PROVIDER, EMBEDDING_MODEL)),
+    factory=os.getenv("VECTOR_INDEX_FACTORY", "Flat"),
+    train_size=int(os.getenv("VECTOR_INDEX_TRAIN_SIZE", "50000")),
+    nprobe=int(os.getenv("VECTOR_INDEX_NPROBE", "16")),
+    ef_search=int(os.getenv("VECTOR_INDEX_EF_SEARCH", "128")),
+    exact_search_max=int(os.getenv("VECTOR_INDEX_EXACT_SEARCH_MAX", "4096")),
+    # 0 picks the index type's default
+    rerank_factor=int(os.getenv("VECTOR_INDEX_RERANK_FACTOR", "0"))
+)
+VECTOR_INDEX_SAVE_INTERVAL = float(os.getenv("VECTOR_INDEX_SAVE_INTERVAL", "300"))
+
+# Document embeddings from every ingestion share one queue, coalesced into
+# batches and paced to the account's rate limit; the scheduler does the retrying.
+# Document Search queries skip the queue but are retried the same way.
+embedding_scheduler = EmbeddingScheduler(
+    functools.partial(llm_clients.embeddings, EMBEDDING_PROVIDER, EMBEDDING_MODEL),
+    max_batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "512")),
+    max_batch_tokens=int(os.getenv("EMBEDDING_BATCH_TOKENS", "100000")),
+    max_concurrency=int(os.getenv("EMBEDDING_CONCURRENCY", "4")),
+    # Local models have no rate limit to respect
+    tokens_per_minute=int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000")) if EMBEDDING_PROVIDER in REMOTE_PROVIDERS else 0,
+    max_retries=int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+)
+
+def get_embeddings() -> CachedEmbeddings:
+    """The configured provider's embeddings, backed by the shared content-addressed cache and the embedding scheduler"""
+    return CachedEmbeddings(ScheduledEmbeddings(embedding_scheduler), embedding_cache)
+
+async def run_in_pool(pool: Executor, func, *args):
+    """Run a blocking call in a worker pool so the event loop keeps serving other requests"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, functools.partial(func, *args))
+
+def replace_parsing_pool(broken: ProcessPoolExecutor):
+    """Swap in a fresh process pool for one whose worker died, unless another call already did"""
+    global parsing_pool
+    if parsing_pool is broken:
+        logger.warning("A PDF parsing worker died; starting a new process pool")
+        parsing_pool = new_parsing_pool()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+async def run_in_parsing_pool(func, *args):
+    """
+    Run a parsing call on the process pool. A worker that dies (out of memory
+    on a huge PDF, a crash in the parser) breaks the whole pool, so it is
+    replaced: calls that were running on it fail, failing their jobs, while
+    later calls, and any submitted after the breakage, run on the new pool.
+    """
+    pool = parsing_pool
+    try:
+        future = pool.submit(func, *args)
+    except BrokenProcessPool:
+        replace_parsing_pool(pool)
+        pool = parsing_pool
+        future = pool.submit(func, *args)
+    try:
+        return await asyncio.wrap_future(future)
+    except BrokenProcessPool:
+        replace_parsing_pool(pool)
+        raise
+
+async def stream_chunks(file_path: str, sha256: str, progress: FileProgress) -> AsyncIterator[List[Document]]:
+    """
+    Yield a PDF's chunks one page range at a time, in page order. A few ranges
+    are parsed ahead on the process pool, so at most that many ranges of pages
+    and chunks are in memory whatever the file's size. Files parsed before are
+    read back from the page cache instead.
+    """
+    page_count = await run_in_pool(io_pool, page_cache.page_count, sha256)
+    cached = page_count is not None
+    if not cached:
+        page_count = await run_in_parsing_pool(pdf_page_count, file_path)
+
+    async def parse_range(start: int, stop: int) -> Tuple[List, List[Document]]:
+        if cached:
+            with span("page_cache_read"):
+                pages = await run_in_pool(io_pool, page_cache.get_pages, sha256, start, stop)
+            # Another ingestion finishing can evict the file mid-read; parse any range that comes back short
+            if len(pages) == stop - start:
+                with span("split"):
+                    return pages, await run_in_parsing_pool(split_pages, page_documents(file_path, pages, start))
+        # Parsing and splitting happen in one call to the process pool, so they are timed together
+        with span("parse"):
+            pages, chunks = await run_in_parsing_pool(parse_page_range, file_path, start, stop)
+        if not cached:
+            await run_in_pool(io_pool, page_cache.put_pages, sha256, start, pages)
+        return pages, chunks
+
+    ranges = iter([
+        (start, min(start + PDF_PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PDF_PAGES_PER_TASK)
+    ])
+    ahead = deque(asyncio.ensure_future(parse_range(*page_range)) for page_range in islice(ranges, PARSE_AHEAD))
+    try:
+        while ahead:
+            pages, chunks = await ahead.popleft()
+            for page_range in islice(ranges, 1):
+                ahead.append(asyncio.ensure_future(parse_range(*page_range)))
+            progress.advance("chunked", pages=progress.pages + len(pages), chunks=progress.chunks + len(chunks))
+            yield chunks
+    finally:
+        for task in ahead:
+            task.cancel()
+    if not cached:
+        await run_in_pool(io_pool, page_cache.complete, sha256, page_count)
+
+async def index_file(document_index: DocumentIndex, file_path: str, file_info: Dict, progress: FileProgress):
+    """Parse, chunk, embed and index one file a page range at a time, reporting progress as it goes"""
+    filename = os.path.basename(file_path)
+    file_info = {**file_info, "sha256": await run_in_pool(io_pool, file_sha256, file_path)}
+    # Drops any previous version of the file; without a size and mtime the entry stays stale until finished
+    await run_in_pool(io_pool, document_index.add_file, filename, {}, [])
+    async with aclosing(stream_chunks(file_path, file_info["sha256"], progress)) as batches:
+        async for chunks in batches:
+            with span("embed"):
+                vectors = await run_in_pool(io_pool, document_index.embed_chunks, chunks)
+            progress.advance("embedded")
+            with span("index"):
+                await run_in_pool(io_pool, document_index.add_chunks, filename, chunks, vectors)
+    with span("index"):
+        await run_in_pool(io_pool, document_index.finish_file, filename, file_info)
+    progress.advance("indexed")
+
+async def sync_document_index(conversation_id: str, job: Optional[IngestionJob] = None) -> DocumentIndex:
+    """Bring a conversation's index in line with its files, embedding only added or changed files"""
+    async with index_locks[conversation_id]:
+        document_index = document_indexes.get(conversation_id)
+        if document_index is None:
+            embeddings = get_embeddings()
+            document_index = await run_in_pool(
+                io_pool, conversation_manager.load_document_index, conversation_id, embeddings, vector_index
+            )
+            if document_index is None:
+                document_index = DocumentIndex(embeddings, vector_index, conversation_id=conversation_id)
+                # Release references taken by a sync that died before it saved anything
+                await run_in_pool(io_pool, document_index.recover)
+        
+        files_dir = os.path.join(conversation_manager.storage_dir, conversation_id, "files")
+        current_files = conversation_manager.get_file_manifest(conversation_id)
+        indexed_files = document_index.file_manifest()
+        
+        changed = False
+        for filename in indexed_files:
+            if filename not in current_files:
+                await run_in_pool(io_pool, document_index.remove_file, filename)
+                changed = True
+        
+        pending = [
+            filename for filename, file_info in current_files.items()
+            if indexed_files.get(filename) != file_info
+        ]
+        try:
+            # Files move through the pipeline independently, so one file's embedding
+            # overlaps the next file's parsing on the process pool
+            results = await asyncio.gather(*[
+                index_file(
+                    document_index,
+                    os.path.join(files_dir, filename),
+                    current_files[filename],
+                    (job.files.get(filename) if job else None) or FileProgress(filename)
+                )
+                for filename in pending
+            ], return_exceptions=True)
+            changed = changed or bool(pending)
+        finally:
+            # Keep whatever was indexed even if one of the files failed
+            if changed:
+                with span("index_save"):
+                    await run_in_pool(io_pool, conversation_manager.save_document_index, conversation_id, document_index)
+            document_indexes[conversation_id] = document_index
+        
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return document_index
+
+async def ingestion_worker():
+    """Take upload jobs off the queue and index their files in the background"""
+    while True:
+        job = await ingestion_queue.get()
+        job.start()
+        job.timings = start_timings(LOG_SAMPLE_RATE)
+        try:
+            document_index = await sync_document_index(job.conversation_id, job)
+            if job.conversation_id not in agents:
+                agents[job.conversation_id] = create_chat_session(job.conversation_id, document_index)
+            job.finish()
+        except Exception as e:
+            job.finish(error=str(e))
+        finally:
+            finish_timings(job.timings, "ingestion", job.status, job_id=job.job_id, conversation_id=job.conversation_id)
+            request_timings.set(None)
+            ingestion_queue.task_done()
+
+class ChatSession:
+    """A conversation's ReAct agent and its single-shot alternative, which share one retriever and LLM"""
+
+    def __init__(self, agent, direct: DirectAnswerer):
+        self.agent = agent
+        self.direct = direct
+
+# Times agent iterations and logs agent steps for sampled requests; stands in for verbose=True
+agent_telemetry = AgentTelemetry()
+
+DOCUMENT_SEARCH = "Document Search"
+DOCUMENT_SEARCH_DESCRIPTION = "Use this tool to search the uploaded documents for relevant information."
+
+@functools.lru_cache(maxsize=None)
+def react_agent(model_name: str) -> ConversationalChatAgent:
+    """
+    The agent's prompt and output parser depend only on the model and the
+    tool's name and description, so one serves every conversation; only the
+    executor around it (tool, memory) is per conversation. The system prompt
+    is passed in with each question as `persona`.
+    """
+    template_tool = Tool(name=DOCUMENT_SEARCH, func=lambda query: "", description=DOCUMENT_SEARCH_DESCRIPTION)
+    return ConversationalChatAgent(
+        llm_chain=LLMChain(llm=llm_clients.chat_model(model_name), prompt=build_agent_prompt([template_tool])),
+        allowed_tools=[DOCUMENT_SEARCH],
+        output_parser=ConvoOutputParser()
+    )
+
+def create_chat_session(conversation_id: str, document_index: DocumentIndex) -> ChatSession:
+    """Build a conversation's ReAct agent and direct answerer around its document index"""
+    # Create retrieval tool; the agent runs via ainvoke, so the coroutine is what normally gets called.
+    # The agent often re-issues the same search within and across turns, so results are memoized.
+    settings = conversation_manager.get_settings(conversation_id) or {}
+    retriever = CachedRetriever(
+        document_index,
+        max_entries=RETRIEVAL_CACHE_MAX_ENTRIES,
+        mode=settings.get("retrieval_mode", RETRIEVAL_MODE),
+        reranker=reranker
+    )
+    
+    def search_docs(query: str) -> str:
+        docs = retriever.search(query, k=5)
+        return "\n\n".join([doc.page_content for doc in docs])
+    
+    async def asearch_docs(query: str) -> str:
+        docs = await retriever.asearch(query, k=5)
+        return "\n\n".join([doc.page_content for doc in docs])
+    
+    retrieval_tool = Tool(
+        name=DOCUMENT_SEARCH,
+        func=search_docs,
+        coroutine=asearch_docs,
+        description=DOCUMENT_SEARCH_DESCRIPTION
+    )
+    
+    # Load or create memory for this conversation
+    memory = conversation_manager.load_conversation(conversation_id)
+    if not memory:
+        memory = ConversationBufferMemory(memory_key="chat_history", input_key="input", output_key="output", return_messages=True)
+    
+    # Wrap the shared agent with this conversation's tool and memory
+    agent = AgentExecutor.from_agent_and_tools(
+        agent=react_agent(CHAT_MODEL),
+        tools=[retrieval_tool],
+        tags=[AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION.value],
+        callbacks=[agent_telemetry],
+        memory=memory,
+        handle_parsing_errors=True
+    )
+    direct = DirectAnswerer(retriever, llm_clients.chat_model(CHAT_MODEL), min_coverage=AUTO_MODE_MIN_COVERAGE)
+    return ChatSession(agent, direct)
 
 def build_system_prompt(assistant_name: str, assistant_behavior: str, custom_instructions: str) -> str:
     """
@@ -57,6 +484,44 @@ Remember to always base your responses on the provided document context while ma
 """
     return base_prompt
 
+async def sweep_idle_sessions():
+    """Evict idle conversations even when no requests arrive to trigger it, and snapshot the shared index"""
+    while True:
+        await asyncio.sleep(60)
+        for cache in (agents, document_indexes, conversation_manager.active_conversations):
+            cache.evict_expired()
+        await run_in_pool(io_pool, vector_index.save, VECTOR_INDEX_SAVE_INTERVAL)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    for _ in range(int(os.getenv("INGESTION_WORKERS", "2"))):
+        background_tasks.append(asyncio.create_task(ingestion_worker()))
+    background_tasks.append(asyncio.create_task(sweep_idle_sessions()))
+
+@app.on_event("startup")
+async def warm_up_embeddings():
+    """Load the embedding model (or open the API connection) before the first upload or question needs it"""
+    if os.getenv("EMBEDDING_WARMUP", "true").lower() != "true":
+        return
+    started = time.perf_counter()
+    try:
+        await run_in_pool(io_pool, embedding_scheduler.embed_query, "warmup")
+    except Exception as e:
+        logger.warning("Embedding warmup failed for %s/%s: %s", EMBEDDING_PROVIDER, EMBEDDING_MODEL, e)
+        return
+    logger.info("Embedding warmup for %s/%s took %.2fs", EMBEDDING_PROVIDER, EMBEDDING_MODEL,
+                time.perf_counter() - started)
+
+@app.on_event("shutdown")
+async def shutdown_worker_pools():
+    for task in background_tasks:
+        task.cancel()
+    parsing_pool.shutdown(cancel_futures=True)
+    embedding_scheduler.close()
+    io_pool.shutdown(cancel_futures=True)
+    vector_index.save()
+    await llm_clients.aclose()
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
@@ -65,6 +530,52 @@ class NewConversationResponse(BaseModel):
     conversation_id: str
     message: str
 
+@app.get("/sessions/stats")
+async def session_stats():
+    """Resident and evicted counts for the in-memory per-conversation caches"""
+    return {
+        "agents": agents.stats(),
+        "document_indexes": document_indexes.stats(),
+        "memories": conversation_manager.active_conversations.stats()
+    }
+
+@app.get("/answers/cache/stats")
+async def answer_cache_stats():
+    """Hit-rate stats for the semantic answer cache"""
+    if answer_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **answer_cache.stats()}
+
+@app.get("/vectors/stats")
+async def vector_index_stats():
+    """Size, index type and deduplication of the shared vector index"""
+    return vector_index.stats()
+
+@app.get("/embeddings/cache/stats")
+async def embedding_cache_stats():
+    """Hit/miss counters for the shared embedding cache"""
+    return embedding_cache.stats()
+
+@app.get("/embeddings/scheduler/stats")
+async def embedding_scheduler_stats():
+    """Batching, retry and rate-limit counters for the embedding scheduler"""
+    return embedding_scheduler.stats()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Latency histograms and token counters in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/llm/stats")
+async def llm_client_stats():
+    """Shared chat/embedding clients and how much of the chat prompts the provider served from its prompt cache"""
+    return llm_clients.stats()
+
+@app.get("/pages/cache/stats")
+async def page_cache_stats():
+    """Hit/miss counters for the extracted page text cache"""
+    return page_cache.stats()
+
 @app.post("/conversations/new", response_model=NewConversationResponse)
 async def create_conversation():
     """Create a new conversation and return its ID"""
@@ -76,132 +587,325 @@ async def create_conversation():
     )
 
 @app.get("/conversations")
-async def list_conversations():
-    """List all conversations"""
-    return conversation_manager.list_conversations()
+async def list_conversations(limit: int = 50, cursor: Optional[str] = None, sort: str = "last_updated"):
+    """List a page of conversations, most recent first; pass next_cursor back as ?cursor= for the next page"""
+    try:
+        conversations, next_cursor = conversation_manager.list_conversations(
+            limit=max(1, min(limit, 500)), cursor=cursor, sort=sort
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"conversations": conversations, "next_cursor": next_cursor}
+
+class ConversationSettings(BaseModel):
+    # Tokens of recent turns sent verbatim; older turns are summarized. 0 sends the full
+    # history and null restores the server default.
+    memory_token_budget: Optional[int] = None
+    # One of dense, lexical or hybrid (dense and BM25 rankings fused)
+    retrieval_mode: Optional[str] = None
+
+@app.get("/conversations/{conversation_id}/settings")
+async def get_conversation_settings(conversation_id: str):
+    """Get a conversation's settings"""
+    settings = conversation_manager.get_settings(conversation_id)
+    if settings is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return settings
+
+@app.put("/conversations/{conversation_id}/settings")
+async def update_conversation_settings(conversation_id: str, settings: ConversationSettings):
+    """Update a conversation's settings; fields left out keep their current values"""
+    changes = settings.model_dump(exclude_unset=True)
+    if (changes.get("memory_token_budget") or 0) < 0:
+        raise HTTPException(status_code=400, detail="memory_token_budget must be 0 or greater")
+    if changes.get("retrieval_mode") not in (None, *RETRIEVAL_MODES):
+        raise HTTPException(status_code=400, detail=f"retrieval_mode must be one of {', '.join(RETRIEVAL_MODES)}")
+    updated = conversation_manager.update_settings(conversation_id, changes)
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    # The chat session holds the old memory; it is rebuilt with the new settings on the next chat
+    agents.pop(conversation_id, None)
+    return updated
 
 @app.post("/conversations/{conversation_id}/upload")
-async def upload_documents(conversation_id: str, files: List[UploadFile] = File(...)):
+async def upload_documents(conversation_id: str, files: List[UploadFile] = File(...), timings: bool = False):
     """Upload documents for a specific conversation"""
+    request = start_timings(LOG_SAMPLE_RATE)
     try:
         # Create a temporary directory for processing files
         with tempfile.TemporaryDirectory() as temp_dir:
-            documents = []
             temp_files = []
             
-            for file in files:
-                temp_file_path = os.path.join(temp_dir, file.filename)
-                with open(temp_file_path, "wb") as f:
-                    f.write(await file.read())
-                temp_files.append(temp_file_path)
-                loader = PyPDFLoader(temp_file_path)
-                docs = loader.load()
-                documents.extend(docs)
-            
-            # Save files to conversation storage
-            conversation_manager.save_files(conversation_id, temp_files)
-            
-            # Process documents
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-            texts = text_splitter.split_documents(documents)
-            
-            embeddings = OpenAIEmbeddings()
-            vector_stores[conversation_id] = FAISS.from_documents(texts, embeddings)
-            
-            # Create retrieval tool
-            retriever = vector_stores[conversation_id].as_retriever(search_kwargs={"k": 5})
-            def search_docs(query: str) -> str:
-                docs = retriever.invoke(query)
-                return "\n\n".join([doc.page_content for doc in docs])
-            
-            retrieval_tool = Tool(
-                name="Document Search",
-                func=search_docs,
-                description="Use this tool to search the uploaded documents for relevant information."
-            )
-            
-            # Load or create memory for this conversation
-            memory = conversation_manager.load_conversation(conversation_id)
-            if not memory:
-                memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-            
-            # Initialize the agent
-            llm = ChatOpenAI(model_name="gpt-4o", temperature=0)
-            agents[conversation_id] = initialize_agent(
-                tools=[retrieval_tool],
-                llm=llm,
-                agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
-                verbose=True,
-                memory=memory,
-                handle_parsing_errors=True
-            )
+            with span("upload_save"):
+                for file in files:
+                    temp_file_path = os.path.join(temp_dir, file.filename)
+                    with open(temp_file_path, "wb") as f:
+                        # Copied in blocks, so an upload is never held in memory whole
+                        await run_in_pool(io_pool, shutil.copyfileobj, file.file, f, UPLOAD_BLOCK_BYTES)
+                    temp_files.append(temp_file_path)
+                
+                # Save files to conversation storage
+                await run_in_pool(io_pool, conversation_manager.save_files, conversation_id, temp_files)
+        
+        # Index the new files in the background; clients poll the job for progress
+        job = job_registry.create(conversation_id, [os.path.basename(path) for path in temp_files])
+        await ingestion_queue.put(job)
             
-        return {"message": "Documents uploaded and processed successfully."}
+        response = {"message": "Documents uploaded, processing started.", "job_id": job.job_id}
+        finish_timings(request, "upload", "queued", response if timings else None, job_id=job.job_id)
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/conversations/{conversation_id}/jobs/{job_id}")
+async def get_ingestion_job(conversation_id: str, job_id: str, timings: bool = False):
+    """Get per-file progress and throughput for an upload job; timings adds where the indexing time went"""
+    job = job_registry.get(conversation_id, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    response = job.to_dict()
+    if timings:
+        response["timings"] = job.timings.to_dict() if job.timings else None
+    return response
+
 class ChatRequest(BaseModel):
     question: str
     assistant_name: str = "AI Assistant"
     assistant_behavior: str = "Professional"
     custom_instructions: str = ""
+    # agent (ReAct, can search several times), direct (one search, one LLM call) or
+    # auto (direct when the question looks simple and the search covers it); defaults to CHAT_MODE
+    mode: Optional[str] = None
+    # Add a per-step latency and token breakdown to the response
+    timings: bool = False
 
-@app.post("/conversations/{conversation_id}/chat")
-async def chat_endpoint(conversation_id: str, chat_req: ChatRequest):
-    """Chat with a specific conversation"""
-    if conversation_id not in agents:
-        # Try to load the conversation if it's not loaded
+NO_DOCUMENTS_ANSWER = "No documents have been uploaded for this conversation. Please upload documents first."
+
+def finish_timings(timings: RequestTimings, endpoint: str, outcome: str, response: Optional[Dict] = None, **fields):
+    """Record a finished request in rag_request_seconds and the sampled log, and add its timings to response if given"""
+    seconds = timings.finish()
+    REQUEST_SECONDS.observe(seconds, endpoint=endpoint, outcome=outcome)
+    log_event(endpoint, outcome=outcome, timings=timings.to_dict(), **fields)
+    if response is not None:
+        response["timings"] = timings.to_dict()
+
+def chat_mode(chat_req: ChatRequest) -> str:
+    mode = chat_req.mode or CHAT_MODE
+    if mode not in CHAT_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(CHAT_MODES)}")
+    return mode
+
+def request_system_prompt(chat_req: ChatRequest) -> str:
+    return build_system_prompt(chat_req.assistant_name, chat_req.assistant_behavior, chat_req.custom_instructions)
+
+async def prepare_chat_session(conversation_id: str) -> Optional[ChatSession]:
+    """Return the conversation's chat session, or None if it has no documents"""
+    session = agents.get(conversation_id)
+    if session is None:
+        # Try to load the conversation if it's not loaded (or was evicted)
         try:
             await load_conversation_documents(conversation_id)
         except Exception:
             pass
         
-        if conversation_id not in agents:
-            return {"answer": "No documents have been uploaded for this conversation. Please upload documents first."}
+        session = agents.get(conversation_id)
+        if session is None:
+            return None
     
-    agent = agents[conversation_id]
+    # The session reaches its index through a closure and its memory through the agent,
+    # so mark both as in use explicitly or they would expire under a live conversation
+    document_indexes.touch(conversation_id)
+    conversation_manager.active_conversations.touch(conversation_id)
+    # The system prompt is not kept in memory: it goes into the prompt ahead of
+    # the history on every call, so the prompt prefix stays stable across turns
+    return session
+
+async def direct_history(conversation_id: str) -> List:
+    """The messages the agent would see as chat_history: summary and recent turns"""
     memory = conversation_manager.load_conversation(conversation_id)
+    return (await memory.aload_memory_variables({}))[memory.memory_key]
+
+async def save_direct_answer(conversation_id: str, question: str, output: str):
+    # The agent saves to memory itself; a direct answer has to do it here
+    memory = conversation_manager.load_conversation(conversation_id)
+    await memory.asave_context({"input": question}, {"output": output})
+    conversation_manager.save_interaction(conversation_id, question, output)
+
+async def answer_from_cache(conversation_id: str, session: ChatSession,
+                            chat_req: ChatRequest) -> Tuple[Optional[str], Callable[[str], None]]:
+    """
+    Look the question up in the answer cache. On a hit the interaction is recorded
+    and the cached answer returned; otherwise the returned callback caches the
+    answer the agent produces.
+    """
+    if answer_cache is None:
+        return None, lambda output: None
     
-    system_prompt_text = build_system_prompt(
-        chat_req.assistant_name,
-        chat_req.assistant_behavior,
-        chat_req.custom_instructions
-    )
+    retriever = session.direct.retriever
+    namespace = AnswerCache.namespace(retriever.document_index.fingerprint(), request_system_prompt(chat_req))
+    # Goes through the session's query memo, so searching for the question itself doesn't embed it again
+    embedding = await retriever.aembed_query(chat_req.question)
+    
+    answer = answer_cache.lookup(namespace, embedding)
+    if answer is not None:
+        # Keep the agent's memory in step with the saved history
+        memory = conversation_manager.load_conversation(conversation_id)
+        memory.save_context({"input": chat_req.question}, {"output": answer})
+        conversation_manager.save_interaction(conversation_id, chat_req.question, answer)
+    
+    return answer, lambda output: answer_cache.store(namespace, chat_req.question, embedding, output)
 
-    # Update system message
-    system_msgs = [m for m in memory.chat_memory.messages if m.type.lower() == "system"]
-    if system_msgs:
-        system_msgs[0].content = system_prompt_text
-    else:
-        memory.chat_memory.messages.insert(0, SystemMessage(content=system_prompt_text))
+@app.post("/conversations/{conversation_id}/chat")
+async def chat_endpoint(conversation_id: str, chat_req: ChatRequest):
+    """Chat with a specific conversation"""
+    mode = chat_mode(chat_req)
+    timings = start_timings(LOG_SAMPLE_RATE)
+    with span("session_load"):
+        session = await prepare_chat_session(conversation_id)
+    if session is None:
+        response = {"answer": NO_DOCUMENTS_ANSWER}
+        finish_timings(timings, "chat", "no_documents", response if chat_req.timings else None,
+                       conversation_id=conversation_id)
+        return response
 
     try:
-        result = agent.invoke(chat_req.question)
-        output = result.get("output")
+        cached_answer, remember_answer = await answer_from_cache(conversation_id, session, chat_req)
+        if cached_answer is not None:
+            response = {"answer": cached_answer, "cached": True}
+            finish_timings(timings, "chat", "cache", response if chat_req.timings else None)
+            return response
         
-        # Save the interaction
-        conversation_manager.save_interaction(
-            conversation_id,
-            chat_req.question,
-            output
-        )
+        stats = RetrievalStats()
+        retrieval_stats.set(stats)
+        system_prompt = request_system_prompt(chat_req)
+        documents = await session.direct.aroute(chat_req.question, mode)
+        if documents is not None:
+            history = await direct_history(conversation_id)
+            output = await session.direct.ainvoke(system_prompt, history, chat_req.question, documents)
+            await save_direct_answer(conversation_id, chat_req.question, output)
+        else:
+            result = await session.agent.ainvoke({"input": chat_req.question, "persona": system_prompt})
+            output = result.get("output")
+            
+            # Save the interaction
+            conversation_manager.save_interaction(
+                conversation_id,
+                chat_req.question,
+                output
+            )
+        remember_answer(output)
         
-        return {"answer": output}
+        response = {
+            "answer": output,
+            "cached": False,
+            "mode": "agent" if documents is None else "direct",
+            "retrieval": stats.to_dict()
+        }
+        finish_timings(timings, "chat", response["mode"], response if chat_req.timings else None,
+                       conversation_id=conversation_id, retrieval=response["retrieval"])
+        return response
     except Exception as e:
+        finish_timings(timings, "chat", "error", conversation_id=conversation_id, error=str(e))
         return {"answer": f"An error occurred: {str(e)}"}
 
-@app.get("/conversations/{conversation_id}/history")
-async def get_conversation_history(conversation_id: str):
-    """Get the chat history for a specific conversation"""
+async def stream_agent_events(conversation_id: str, session: ChatSession, chat_req: ChatRequest, mode: str,
+                              timings: RequestTimings):
+    """Answer the question and yield tool calls and final-answer tokens as SSE events"""
+    question = chat_req.question
+    agent = session.agent
+    answer_streamer = FinalAnswerStreamer()
+    tool_input = None
+    request_timings.set(timings)
+    finished = False
+
+    def done(response: Dict, outcome: str) -> str:
+        nonlocal finished
+        finished = True
+        finish_timings(timings, "chat_stream", outcome, response if chat_req.timings else None,
+                       conversation_id=conversation_id, retrieval=response.get("retrieval"))
+        return sse_event("done", response)
+
     try:
-        conv_dir = os.path.join(conversation_manager.storage_dir, conversation_id)
-        history_file = os.path.join(conv_dir, "history.json")
+        cached_answer, remember_answer = await answer_from_cache(conversation_id, session, chat_req)
+        if cached_answer is not None:
+            yield done({"answer": cached_answer, "cached": True}, "cache")
+            return
         
-        if not os.path.exists(history_file):
-            return {"messages": []}
-            
-        with open(history_file, "r") as f:
-            history = json.load(f)
+        stats = RetrievalStats()
+        retrieval_stats.set(stats)
+        system_prompt = request_system_prompt(chat_req)
+        documents = await session.direct.aroute(question, mode)
+        if documents is not None:
+            yield sse_event("tool_start", {"tool": DOCUMENT_SEARCH, "input": question})
+            yield sse_event("tool_end", {
+                "tool": DOCUMENT_SEARCH,
+                "output": "\n\n".join(doc.page_content for doc in documents)
+            })
+            history = await direct_history(conversation_id)
+            parts = []
+            async for text in session.direct.astream(system_prompt, history, question, documents):
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+            output = "".join(parts)
+            await save_direct_answer(conversation_id, question, output)
+            remember_answer(output)
+            yield done({"answer": output, "cached": False, "mode": "direct", "retrieval": stats.to_dict()}, "direct")
+            return
+        
+        async for event in agent.astream_events({"input": question, "persona": system_prompt}, version="v2"):
+            kind = event["event"]
+            if kind == "on_chat_model_start":
+                answer_streamer.reset()
+            elif kind == "on_chat_model_stream":
+                text = answer_streamer.feed(event["data"]["chunk"].content)
+                if text:
+                    yield sse_event("token", {"text": text})
+            elif kind == "on_chat_model_end":
+                # Legacy tools don't report their input in events, so take it from the agent's decision
+                try:
+                    step = agent.agent.output_parser.parse(event["data"]["output"].content)
+                    tool_input = getattr(step, "tool_input", None)
+                except Exception:
+                    tool_input = None
+            elif kind == "on_tool_start":
+                yield sse_event("tool_start", {"tool": event["name"], "input": tool_input})
+            elif kind == "on_tool_end":
+                yield sse_event("tool_end", {"tool": event["name"], "output": str(event["data"].get("output"))})
+            elif kind == "on_chain_end" and not event["parent_ids"]:
+                output = event["data"]["output"]["output"]
+                conversation_manager.save_interaction(conversation_id, question, output)
+                remember_answer(output)
+                yield done({"answer": output, "cached": False, "mode": "agent", "retrieval": stats.to_dict()}, "agent")
+    except Exception as e:
+        finished = True
+        finish_timings(timings, "chat_stream", "error", conversation_id=conversation_id, error=str(e))
+        yield sse_event("error", {"detail": f"An error occurred: {str(e)}"})
+    finally:
+        # The client went away before the answer was complete
+        if not finished:
+            finish_timings(timings, "chat_stream", "cancelled", conversation_id=conversation_id)
+
+@app.post("/conversations/{conversation_id}/chat/stream")
+async def chat_stream_endpoint(conversation_id: str, chat_req: ChatRequest):
+    """Chat with a specific conversation, streaming agent steps and answer tokens as Server-Sent Events"""
+    mode = chat_mode(chat_req)
+    timings = start_timings(LOG_SAMPLE_RATE)
+    with span("session_load"):
+        session = await prepare_chat_session(conversation_id)
+    if session is None:
+        response = {"answer": NO_DOCUMENTS_ANSWER}
+        finish_timings(timings, "chat_stream", "no_documents", response if chat_req.timings else None,
+                       conversation_id=conversation_id)
+        events = iter([sse_event("done", response)])
+    else:
+        events = stream_agent_events(conversation_id, session, chat_req, mode, timings)
+    return StreamingResponse(events, media_type="text/event-stream")
+
+@app.get("/conversations/{conversation_id}/history")
+async def get_conversation_history(conversation_id: str, before: Optional[int] = None, limit: int = 50):
+    """Get a page of the chat history for a specific conversation, newest page first"""
+    try:
+        history = conversation_manager.get_history(conversation_id, before=before, limit=max(1, min(limit, 500)))
             
         # Convert the history format to match the frontend's expected format
         messages = []
@@ -210,8 +914,10 @@ async def get_conversation_history(conversation_id: str):
                 {"role": "user", "content": interaction["human_message"]},
                 {"role": "assistant", "content": interaction["ai_message"]}
             ])
-            
-        return {"messages": messages}
+        
+        # Pass next_before back as ?before= to fetch the previous page
+        next_before = history[0]["seq"] if history and history[0]["seq"] > 0 else None
+        return {"messages": messages, "next_before": next_before}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -240,6 +946,19 @@ async def get_conversation_files(conversation_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.delete("/conversations/{conversation_id}/files/{filename}")
+async def delete_conversation_file(conversation_id: str, filename: str):
+    """Remove a file and its vectors from a conversation"""
+    if os.path.basename(filename) != filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    if not conversation_manager.delete_file(conversation_id, filename):
+        raise HTTPException(status_code=404, detail="File not found")
+    try:
+        await sync_document_index(conversation_id)
+        return {"message": f"{filename} removed successfully."}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 async def load_conversation_documents(conversation_id: str):
     """Load and process documents for an existing conversation"""
     try:
@@ -249,49 +968,10 @@ async def load_conversation_documents(conversation_id: str):
         if not os.path.exists(files_dir):
             return
             
-        documents = []
-        for filename in os.listdir(files_dir):
-            if filename.endswith('.pdf'):
-                file_path = os.path.join(files_dir, filename)
-                loader = PyPDFLoader(file_path)
-                docs = loader.load()
-                documents.extend(docs)
-        
-        if documents:
-            # Process documents
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-            texts = text_splitter.split_documents(documents)
-            
-            embeddings = OpenAIEmbeddings()
-            vector_stores[conversation_id] = FAISS.from_documents(texts, embeddings)
-            
-            # Create retrieval tool
-            retriever = vector_stores[conversation_id].as_retriever(search_kwargs={"k": 5})
-            def search_docs(query: str) -> str:
-                docs = retriever.invoke(query)
-                return "\n\n".join([doc.page_content for doc in docs])
-            
-            retrieval_tool = Tool(
-                name="Document Search",
-                func=search_docs,
-                description="Use this tool to search the uploaded documents for relevant information."
-            )
-            
-            # Load or create memory for this conversation
-            memory = conversation_manager.load_conversation(conversation_id)
-            if not memory:
-                memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-            
-            # Initialize the agent
-            llm = ChatOpenAI(model_name="gpt-4", temperature=0)
-            agents[conversation_id] = initialize_agent(
-                tools=[retrieval_tool],
-                llm=llm,
-                agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
-                verbose=True,
-                memory=memory,
-                handle_parsing_errors=True
-            )
+        # Reuse the saved index, only embedding files that changed since it was built
+        document_index = await sync_document_index(conversation_id)
+        if document_index.files:
+            agents[conversation_id] = create_chat_session(conversation_id, document_index)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
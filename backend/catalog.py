@@ -0,0 +1,94 @@
+import base64
+import json
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+SORT_COLUMNS = ("last_updated", "created_at")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except ValueError:
+        position = None
+    if not (isinstance(position, list) and len(position) == 2 and all(isinstance(value, str) for value in position)):
+        raise ValueError("Invalid cursor")
+    return position[0], position[1]
+
+
+class ConversationCatalog:
+    """Indexed SQLite table of conversation metadata, so listing doesn't touch every conversation directory"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "conversation_id TEXT PRIMARY KEY, created_at TEXT NOT NULL, "
+            "last_updated TEXT NOT NULL, message_count INTEGER NOT NULL)"
+        )
+        for column in SORT_COLUMNS:
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_conversations_{column} ON conversations ({column}, conversation_id)"
+            )
+        self._conn.commit()
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM conversations LIMIT 1").fetchone() is None
+
+    def upsert(self, conversation_id: str, metadata: Dict):
+        """Insert or refresh a conversation's row from its metadata.json contents"""
+        self.upsert_many([(conversation_id, metadata)])
+
+    def upsert_many(self, rows: List[Tuple[str, Dict]]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO conversations (conversation_id, created_at, last_updated, message_count) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT(conversation_id) DO UPDATE SET "
+                "last_updated = excluded.last_updated, message_count = excluded.message_count",
+                [
+                    (conversation_id, metadata["created_at"], metadata["last_updated"], metadata["message_count"])
+                    for conversation_id, metadata in rows
+                ]
+            )
+            self._conn.commit()
+
+    def list(self, limit: int = 50, cursor: Optional[str] = None,
+             sort: str = "last_updated") -> Tuple[List[Dict], Optional[str]]:
+        """Return one page of conversations, newest first, and the cursor for the next page"""
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_COLUMNS)}")
+
+        # Keyset pagination: resume strictly after the last (sort value, id) of the previous page
+        query = "SELECT conversation_id, created_at, last_updated, message_count FROM conversations"
+        params: list = []
+        if cursor:
+            sort_value, conversation_id = _decode_cursor(cursor)
+            query += f" WHERE ({sort}, conversation_id) < (?, ?)"
+            params.extend([sort_value, conversation_id])
+        query += f" ORDER BY {sort} DESC, conversation_id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        conversations = [
+            {
+                "conversation_id": row[0],
+                "created_at": row[1],
+                "last_updated": row[2],
+                "message_count": row[3]
+            }
+            for row in rows[:limit]
+        ]
+        next_cursor = None
+        if len(rows) > limit:
+            last = conversations[-1]
+            next_cursor = base64.urlsafe_b64encode(
+                json.dumps([last[sort], last["conversation_id"]]).encode()
+            ).decode()
+        return conversations, next_cursor
@@ -1,16 +1,38 @@
 import os
 import json
+import fcntl
+import threading
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterator, List, MutableMapping, Optional, Tuple
 import shutil
 from langchain.memory import ConversationBufferMemory
+from langchain.memory.chat_memory import BaseChatMemory
 from langchain.schema import HumanMessage, AIMessage
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseLanguageModel
+
+from catalog import ConversationCatalog
+from document_index import DocumentIndex
+from lexical_index import LexicalIndex
+from shared_index import SharedVectorIndex
+from token_budget_memory import TokenBudgetMemory
 
 class ConversationManager:
-    def __init__(self, storage_dir: str = "conversations"):
+    def __init__(self, storage_dir: str = "conversations",
+                 active_conversations: Optional[MutableMapping[str, BaseChatMemory]] = None,
+                 default_settings: Optional[Dict] = None,
+                 summarizer: Optional[Callable[[], BaseLanguageModel]] = None):
         self.storage_dir = storage_dir
         self.ensure_storage_directory()
-        self.active_conversations: Dict[str, ConversationBufferMemory] = {}
+        # Memories are rebuilt from history.json on demand, so callers may pass a bounded cache here
+        self.active_conversations = active_conversations if active_conversations is not None else {}
+        # Settings a conversation uses unless it overrides them, e.g. memory_token_budget
+        self.default_settings = default_settings or {}
+        self.summarizer = summarizer
+        self._migration_lock = threading.Lock()
+        self.catalog = ConversationCatalog(os.path.join(self.storage_dir, "catalog.sqlite"))
+        if self.catalog.is_empty():
+            self._backfill_catalog()
         
     def ensure_storage_directory(self):
         """Ensure the storage directory exists"""
@@ -31,88 +53,329 @@ class ConversationManager:
         
         with open(os.path.join(conv_dir, "metadata.json"), "w") as f:
             json.dump(metadata, f)
+        self.catalog.upsert(conversation_id, metadata)
             
-        # Initialize empty conversation history
-        with open(os.path.join(conv_dir, "history.json"), "w") as f:
-            json.dump([], f)
+        # Initialize empty conversation history (one JSON interaction per line)
+        open(os.path.join(conv_dir, "history.jsonl"), "a").close()
             
         # Initialize memory for this conversation
-        self.active_conversations[conversation_id] = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
-        )
+        self.active_conversations[conversation_id] = self._new_memory(conversation_id)
         
         return conversation_id
+
+    def get_settings(self, conversation_id: str) -> Optional[Dict]:
+        """A conversation's settings with defaults filled in, or None if it does not exist"""
+        metadata_file = os.path.join(self.storage_dir, conversation_id, "metadata.json")
+        if not os.path.exists(metadata_file):
+            return None
+        with open(metadata_file, "r") as f:
+            settings = json.load(f).get("settings", {})
+        return {**self.default_settings, **settings}
+
+    def update_settings(self, conversation_id: str, settings: Dict) -> Optional[Dict]:
+        """Merge settings into a conversation's metadata and drop its memory so they take effect"""
+        conv_dir = os.path.join(self.storage_dir, conversation_id)
+        metadata_file = os.path.join(conv_dir, "metadata.json")
+        if not os.path.exists(metadata_file):
+            return None
+
+        fd = os.open(self._history_file(conversation_id), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            # Same lock as save_interaction, which also rewrites metadata.json
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with open(metadata_file, "r") as f:
+                metadata = json.load(f)
+            merged = {**metadata.get("settings", {}), **settings}
+            # None resets a setting to the server default
+            metadata["settings"] = {key: value for key, value in merged.items() if value is not None}
+            temp_file = metadata_file + ".tmp"
+            with open(temp_file, "w") as f:
+                json.dump(metadata, f)
+            os.replace(temp_file, metadata_file)
+        finally:
+            os.close(fd)
+
+        self.active_conversations.pop(conversation_id, None)
+        return self.get_settings(conversation_id)
+
+    def save_summary(self, conversation_id: str, summary: str, summarized_turns: int):
+        """Persist the rolling summary of a conversation's oldest turns"""
+        summary_file = os.path.join(self.storage_dir, conversation_id, "summary.json")
+        temp_file = summary_file + ".tmp"
+        with open(temp_file, "w") as f:
+            json.dump({"summary": summary, "summarized_turns": summarized_turns}, f)
+        os.replace(temp_file, summary_file)
+
+    def _load_summary(self, conversation_id: str) -> Tuple[str, int]:
+        summary_file = os.path.join(self.storage_dir, conversation_id, "summary.json")
+        if not os.path.exists(summary_file):
+            return "", 0
+        with open(summary_file, "r") as f:
+            data = json.load(f)
+        return data["summary"], data["summarized_turns"]
+
+    def _new_memory(self, conversation_id: str) -> BaseChatMemory:
+        """Empty memory for a conversation, token-budgeted unless its budget is 0"""
+        settings = self.get_settings(conversation_id) or self.default_settings
+        # A budget of 0 keeps the full history
+        budget = settings.get("memory_token_budget", 0)
+        # The agent also gets the system prompt as an input and returns more than the answer, so name both
+        if not budget or self.summarizer is None:
+            return ConversationBufferMemory(memory_key="chat_history", input_key="input", output_key="output", return_messages=True)
+
+        summary, summarized_turns = self._load_summary(conversation_id)
+        return TokenBudgetMemory(
+            llm=self.summarizer(),
+            max_token_limit=budget,
+            memory_key="chat_history",
+            input_key="input",
+            output_key="output",
+            return_messages=True,
+            moving_summary_buffer=summary,
+            summarized_turns=summarized_turns,
+            on_summarize=lambda summary, turns: self.save_summary(conversation_id, summary, turns)
+        )
         
     def save_files(self, conversation_id: str, files: List[str]):
         """Save uploaded files for a conversation"""
         files_dir = os.path.join(self.storage_dir, conversation_id, "files")
         for file in files:
             shutil.copy2(file, files_dir)
+
+    def get_file_manifest(self, conversation_id: str) -> Dict[str, Dict]:
+        """Describe a conversation's PDF files so a saved index can be checked for staleness"""
+        files_dir = os.path.join(self.storage_dir, conversation_id, "files")
+        if not os.path.exists(files_dir):
+            return {}
+
+        manifest = {}
+        for filename in sorted(os.listdir(files_dir)):
+            if not filename.endswith('.pdf'):
+                continue
+            stat = os.stat(os.path.join(files_dir, filename))
+            manifest[filename] = {"size": stat.st_size, "mtime": stat.st_mtime}
+        return manifest
+
+    def delete_file(self, conversation_id: str, filename: str) -> bool:
+        """Delete an uploaded file from a conversation, returning False if it does not exist"""
+        file_path = os.path.join(self.storage_dir, conversation_id, "files", filename)
+        if not os.path.isfile(file_path):
+            return False
+        os.remove(file_path)
+        return True
+
+    def save_document_index(self, conversation_id: str, document_index: DocumentIndex):
+        """Persist a conversation's BM25 index and per-file chunk IDs; vectors live in the shared index"""
+        index_dir = os.path.join(self.storage_dir, conversation_id, "index")
+        os.makedirs(index_dir, exist_ok=True)
+        manifest_file = os.path.join(index_dir, "manifest.json")
+
+        # Drop the manifest first so a partially written index is never treated as valid
+        if os.path.exists(manifest_file):
+            os.remove(manifest_file)
+
+        # Per-conversation FAISS files from before the shared index
+        for stale_file in ("index.faiss", "index.pkl"):
+            if os.path.exists(os.path.join(index_dir, stale_file)):
+                os.remove(os.path.join(index_dir, stale_file))
+
+        with document_index.lock:
+            with open(os.path.join(index_dir, "lexical.json"), "w") as f:
+                json.dump(document_index.lexical_index.to_dict(), f)
+
+            with open(manifest_file, "w") as f:
+                json.dump({
+                    "store": "shared",
+                    # Chunk IDs are only meaningful in the shared index of the embedding model that made them
+                    "vectors": os.path.basename(document_index.store.directory),
+                    # The store records which of these chunks each file holds a reference to
+                    "chunk_owners": True,
+                    "files": document_index.files
+                }, f)
+
+    def load_document_index(self, conversation_id: str, embeddings: Embeddings,
+                            store: SharedVectorIndex) -> Optional[DocumentIndex]:
+        """Load a conversation's saved index, or None if there is no usable saved index"""
+        index_dir = os.path.join(self.storage_dir, conversation_id, "index")
+        manifest_file = os.path.join(index_dir, "manifest.json")
+        if not os.path.exists(manifest_file):
+            return None
+
+        with open(manifest_file, "r") as f:
+            manifest = json.load(f)
+
+        # Per-conversation FAISS indexes are rebuilt into the shared index from the files;
+        # the embedding cache means their chunks aren't embedded again
+        if manifest.get("store") != "shared":
+            return None
+        # Indexed with another embedding model; rebuilt the same way
+        if manifest.get("vectors") != os.path.basename(store.directory):
+            return None
+
+        lexical_index = None
+        lexical_file = os.path.join(index_dir, "lexical.json")
+        if os.path.exists(lexical_file):
+            with open(lexical_file, "r") as f:
+                lexical_index = LexicalIndex.from_dict(json.load(f))
+
+        document_index = DocumentIndex(
+            embeddings, store, manifest["files"], lexical_index, conversation_id=conversation_id
+        )
+        # The store's reference counts may be ahead of this manifest if the process died mid-sync
+        document_index.recover(legacy=not manifest.get("chunk_owners"))
+        return document_index
             
+    def _history_file(self, conversation_id: str) -> str:
+        """Path of the conversation's append-only history log, migrating a legacy history.json if needed"""
+        conv_dir = os.path.join(self.storage_dir, conversation_id)
+        history_file = os.path.join(conv_dir, "history.jsonl")
+        legacy_file = os.path.join(conv_dir, "history.json")
+        if os.path.exists(history_file) or not os.path.exists(legacy_file):
+            return history_file
+
+        with self._migration_lock:
+            if os.path.exists(history_file):
+                return history_file
+            with open(legacy_file, "r") as f:
+                history = json.load(f)
+            temp_file = history_file + ".tmp"
+            with open(temp_file, "w") as f:
+                for seq, interaction in enumerate(history):
+                    f.write(json.dumps({"seq": seq, **interaction}) + "\n")
+            os.replace(temp_file, history_file)
+            os.remove(legacy_file)
+        return history_file
+
     def save_interaction(self, conversation_id: str, human_message: str, ai_message: str):
-        """Save a conversation interaction"""
+        """Append a conversation interaction to the history log and bump the metadata counter"""
         conv_dir = os.path.join(self.storage_dir, conversation_id)
-        history_file = os.path.join(conv_dir, "history.json")
+        history_file = self._history_file(conversation_id)
+        metadata_file = os.path.join(conv_dir, "metadata.json")
         
-        # Load existing history
-        with open(history_file, "r") as f:
-            history = json.load(f)
+        fd = os.open(history_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            # Serialise writers to this conversation, including other worker processes
+            fcntl.flock(fd, fcntl.LOCK_EX)
             
-        # Add new interaction
-        history.append({
-            "timestamp": datetime.now().isoformat(),
-            "human_message": human_message,
-            "ai_message": ai_message
-        })
-        
-        # Save updated history
-        with open(history_file, "w") as f:
-            json.dump(history, f)
+            with open(metadata_file, "r") as f:
+                metadata = json.load(f)
             
-        # Update metadata
-        metadata_file = os.path.join(conv_dir, "metadata.json")
-        with open(metadata_file, "r") as f:
-            metadata = json.load(f)
-        
-        metadata["last_updated"] = datetime.now().isoformat()
-        metadata["message_count"] = len(history)
-        
-        with open(metadata_file, "w") as f:
-            json.dump(metadata, f)
+            interaction = {
+                "seq": metadata["message_count"],
+                "timestamp": datetime.now().isoformat(),
+                "human_message": human_message,
+                "ai_message": ai_message
+            }
+            # A single O_APPEND write, so readers never see a partially interleaved line
+            os.write(fd, (json.dumps(interaction) + "\n").encode("utf-8"))
+            
+            metadata["last_updated"] = interaction["timestamp"]
+            metadata["message_count"] += 1
+            temp_file = metadata_file + ".tmp"
+            with open(temp_file, "w") as f:
+                json.dump(metadata, f)
+            os.replace(temp_file, metadata_file)
+            self.catalog.upsert(conversation_id, metadata)
+        finally:
+            os.close(fd)
+
+    def iter_history(self, conversation_id: str) -> Iterator[Dict]:
+        """Yield a conversation's interactions oldest first"""
+        history_file = self._history_file(conversation_id)
+        if not os.path.exists(history_file):
+            return
+        with open(history_file, "r") as f:
+            for line in f:
+                interaction = self._parse_history_line(line)
+                if interaction is not None:
+                    yield interaction
+
+    def get_history(self, conversation_id: str, before: Optional[int] = None,
+                    limit: int = 50) -> List[Dict]:
+        """Return up to `limit` interactions with seq < before (default: the latest), oldest first"""
+        history_file = self._history_file(conversation_id)
+        if not os.path.exists(history_file):
+            return []
+
+        page = []
+        for line in self._read_lines_reversed(history_file):
+            interaction = self._parse_history_line(line)
+            if interaction is None:
+                continue
+            if before is not None and interaction["seq"] >= before:
+                continue
+            page.append(interaction)
+            if len(page) >= limit:
+                break
+        page.reverse()
+        return page
+
+    @staticmethod
+    def _parse_history_line(line) -> Optional[Dict]:
+        # A crash mid-append can leave a truncated last line; skip it rather than failing the read
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _read_lines_reversed(path: str, block_size: int = 65536) -> Iterator[bytes]:
+        """Yield a file's non-empty lines last first, reading backwards in blocks"""
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            remainder = b""
+            while position > 0:
+                read_size = min(block_size, position)
+                position -= read_size
+                f.seek(position)
+                lines = (f.read(read_size) + remainder).split(b"\n")
+                # The first piece may continue in the previous block
+                remainder = lines.pop(0)
+                for line in reversed(lines):
+                    if line.strip():
+                        yield line
+            if remainder.strip():
+                yield remainder
             
-    def load_conversation(self, conversation_id: str) -> Optional[ConversationBufferMemory]:
+    def load_conversation(self, conversation_id: str) -> Optional[BaseChatMemory]:
         """Load a conversation's memory from storage"""
-        if conversation_id in self.active_conversations:
-            return self.active_conversations[conversation_id]
+        memory = self.active_conversations.get(conversation_id)
+        if memory is not None:
+            return memory
             
         conv_dir = os.path.join(self.storage_dir, conversation_id)
         if not os.path.exists(conv_dir):
             return None
             
-        # Load history
-        with open(os.path.join(conv_dir, "history.json"), "r") as f:
-            history = json.load(f)
-            
         # Create new memory instance
-        memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+        memory = self._new_memory(conversation_id)
         
-        # Reconstruct memory from history
-        for interaction in history:
+        # Reconstruct memory from history, skipping turns already folded into the summary
+        skip = getattr(memory, "summarized_turns", 0)
+        for position, interaction in enumerate(self.iter_history(conversation_id)):
+            if position < skip:
+                continue
             memory.chat_memory.messages.append(HumanMessage(content=interaction["human_message"]))
             memory.chat_memory.messages.append(AIMessage(content=interaction["ai_message"]))
             
         self.active_conversations[conversation_id] = memory
         return memory
         
-    def list_conversations(self) -> List[Dict]:
-        """List all conversations with their metadata"""
-        conversations = []
+    def list_conversations(self, limit: int = 50, cursor: Optional[str] = None,
+                           sort: str = "last_updated") -> Tuple[List[Dict], Optional[str]]:
+        """List a page of conversations with their metadata, plus the cursor for the next page"""
+        return self.catalog.list(limit=limit, cursor=cursor, sort=sort)
+
+    def _backfill_catalog(self):
+        """Populate the catalog from metadata.json files written before it existed"""
+        rows = []
         for conv_id in os.listdir(self.storage_dir):
             conv_dir = os.path.join(self.storage_dir, conv_id)
-            if os.path.isdir(conv_dir):
-                with open(os.path.join(conv_dir, "metadata.json"), "r") as f:
-                    metadata = json.load(f)
-                metadata["conversation_id"] = conv_id
-                conversations.append(metadata)
-        return conversations 
\ No newline at end of file
+            metadata_file = os.path.join(conv_dir, "metadata.json")
+            # Skip non-conversation entries such as the shared cache directory
+            if os.path.isdir(conv_dir) and os.path.exists(metadata_file):
+                with open(metadata_file, "r") as f:
+                    rows.append((conv_id, json.load(f)))
+        if rows:
+            self.catalog.upsert_many(rows)
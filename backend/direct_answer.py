@@ -0,0 +1,91 @@
+import re
+from typing import AsyncIterator, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from lexical_index import tokenize
+from retrieval_cache import CachedRetriever
+
+CHAT_MODES = ("agent", "direct", "auto")
+
+# Words that carry no signal about whether the documents cover a question
+_STOPWORDS = {
+    "a", "about", "an", "and", "any", "are", "as", "at", "be", "by", "can", "could", "did", "do", "does",
+    "for", "from", "give", "has", "have", "how", "i", "in", "is", "it", "its", "me", "my", "of", "on",
+    "or", "please", "should", "tell", "that", "the", "their", "there", "these", "this", "those", "to",
+    "was", "we", "were", "what", "when", "where", "which", "who", "why", "will", "with", "would", "you", "your"
+}
+# Phrasings that usually need several searches, which only the agent can do
+_MULTI_STEP = re.compile(
+    r"\b(compare|comparison|versus|vs\.?|differences?\s+between|contrast|step[- ]by[- ]step|and\s+also|as\s+well\s+as)\b",
+    re.IGNORECASE
+)
+
+ANSWER_PROMPT = (
+    "Answer the question using the document excerpts below. If they don't contain "
+    "the answer, say so rather than guessing.\n\n"
+    "Document excerpts:\n{context}\n\n"
+    "Question: {question}"
+)
+
+
+def coverage(question: str, documents: List[Document]) -> float:
+    """Share of the question's content words that appear in the retrieved chunks"""
+    terms = {term for term in tokenize(question) if term not in _STOPWORDS}
+    if not terms:
+        return 0.0
+    found = set()
+    for doc in documents:
+        found.update(tokenize(doc.page_content))
+    return len(terms & found) / len(terms)
+
+
+def needs_agent(question: str) -> bool:
+    """Cheap check for questions that are likely to take more than one search"""
+    return question.count("?") > 1 or bool(_MULTI_STEP.search(question))
+
+
+class DirectAnswerer:
+    """
+    Answers with one retrieval and one LLM call, skipping the agent's round
+    trip to decide on a tool call. In auto mode a question only takes this
+    path if it looks self-contained and the retrieved chunks cover at least
+    min_coverage of its content words; otherwise it goes to the agent.
+    """
+
+    def __init__(self, retriever: CachedRetriever, llm: BaseChatModel, min_coverage: float = 0.75, k: int = 5):
+        self.retriever = retriever
+        self.llm = llm
+        self.min_coverage = min_coverage
+        self.k = k
+
+    async def aroute(self, question: str, mode: str) -> Optional[List[Document]]:
+        """Retrieve context for a direct answer, or return None if the question should go to the agent"""
+        if mode == "agent" or (mode == "auto" and needs_agent(question)):
+            return None
+        # Counted apart from the agent's tool calls, which auto mode may still go on to make
+        documents = await self.retriever.asearch(question, k=self.k, count_as="routing_searches")
+        if mode == "auto" and coverage(question, documents) < self.min_coverage:
+            return None
+        return documents
+
+    def messages(self, system_prompt: str, history: List[BaseMessage], question: str,
+                 documents: List[Document]) -> List[BaseMessage]:
+        """System prompt, then the conversation so far, then the question with its context, most stable first"""
+        context = "\n\n".join(doc.page_content for doc in documents)
+        return [SystemMessage(content=system_prompt)] + history + [
+            HumanMessage(content=ANSWER_PROMPT.format(context=context, question=question))
+        ]
+
+    async def ainvoke(self, system_prompt: str, history: List[BaseMessage], question: str,
+                      documents: List[Document]) -> str:
+        response = await self.llm.ainvoke(self.messages(system_prompt, history, question, documents))
+        return response.content
+
+    async def astream(self, system_prompt: str, history: List[BaseMessage], question: str,
+                      documents: List[Document]) -> AsyncIterator[str]:
+        async for chunk in self.llm.astream(self.messages(system_prompt, history, question, documents)):
+            if chunk.content:
+                yield chunk.content
@@ -0,0 +1,220 @@
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from lexical_index import LexicalIndex
+from shared_index import SharedVectorIndex
+
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
+# Reciprocal rank fusion constant; larger values flatten the advantage of top ranks
+RRF_K = 60
+
+
+class DocumentIndex:
+    """
+    A conversation's view of the shared vector index: the chunk IDs and metadata
+    contributed by each file, plus a BM25 index over them. Chunk text and vectors
+    live in the SharedVectorIndex.
+    """
+
+    def __init__(self, embeddings: Embeddings, store: SharedVectorIndex,
+                 files: Optional[Dict[str, Dict]] = None, lexical_index: Optional[LexicalIndex] = None,
+                 conversation_id: Optional[str] = None):
+        self.embeddings = embeddings
+        self.store = store
+        # Names this conversation's references in the store, so they can be reconciled after a crash
+        self.conversation_id = conversation_id
+        # filename -> {"size": ..., "mtime": ..., "chunk_ids": [...], "chunk_metadata": [...]}
+        self.files: Dict[str, Dict] = files or {}
+        self._chunk_metadata: Dict[int, Dict] = {}
+        for info in self.files.values():
+            self._chunk_metadata.update(zip(info["chunk_ids"], info["chunk_metadata"]))
+        if lexical_index is None:
+            lexical_index = LexicalIndex()
+            for chunk_id, text in store.get_texts(list(self._chunk_metadata)).items():
+                lexical_index.add(chunk_id, text)
+        self.lexical_index = lexical_index
+        # Ingestion threads mutate the index while agent tool calls search it
+        self.lock = threading.RLock()
+        # Bumped on every change so cached search results can tell they are stale
+        self.version = 0
+
+    def memory_bytes(self) -> int:
+        """Rough resident size: chunk IDs and metadata plus BM25 term counts"""
+        with self.lock:
+            terms = sum(len(counts) for counts in self.lexical_index.documents.values())
+            return len(self._chunk_metadata) * 200 + terms * 100
+
+    def chunk_ids(self) -> List[int]:
+        with self.lock:
+            return list(self._chunk_metadata)
+
+    def file_manifest(self) -> Dict[str, Dict]:
+        """The indexed files' size and mtime, comparable to ConversationManager.get_file_manifest"""
+        return {
+            filename: {"size": info.get("size"), "mtime": info.get("mtime")}
+            for filename, info in self.files.items()
+        }
+
+    def fingerprint(self) -> str:
+        """Hash of the indexed file contents, identical for any conversation holding the same documents"""
+        digests = sorted(
+            info.get("sha256") or f"{filename}:{info.get('size')}:{info.get('mtime')}"
+            for filename, info in self.files.items()
+        )
+        return hashlib.sha256("\n".join(digests).encode("utf-8")).hexdigest()
+
+    def _owner(self, filename: str) -> Optional[str]:
+        return f"{self.conversation_id}/{filename}" if self.conversation_id is not None else None
+
+    def recover(self, legacy: bool = False):
+        """
+        Reconcile the files with the references the store says this conversation holds, which can
+        disagree if the process died before the files were saved. A file whose references don't match
+        is dropped, releasing what the store recorded, so the next sync indexes it again; references
+        held for files not listed are released. With legacy, files saved before owners were recorded
+        adopt their references instead.
+        """
+        if self.conversation_id is None:
+            return
+        prefix = f"{self.conversation_id}/"
+        with self.lock:
+            owned = self.store.owned(prefix)
+            for filename in list(self.files):
+                owner = self._owner(filename)
+                held = owned.pop(owner, [])
+                chunk_ids = self.files[filename]["chunk_ids"]
+                if sorted(held) == sorted(chunk_ids):
+                    continue
+                if legacy and not held:
+                    self.store.adopt(owner, chunk_ids)
+                    continue
+                self.store.release(held, owner)
+                self._forget(filename)
+            for owner, held in owned.items():
+                self.store.release(held, owner)
+
+    def embed_chunks(self, chunks: List[Document]) -> List[List[float]]:
+        """Embed chunks without touching the index, so searches aren't blocked on the embedding backend"""
+        if not chunks:
+            return []
+        return self.embeddings.embed_documents([chunk.page_content for chunk in chunks])
+
+    def add_file(self, filename: str, file_info: Dict, chunks: List[Document],
+                 vectors: Optional[List[List[float]]] = None):
+        """Index a file's chunks, replacing any chunks previously indexed for the same filename"""
+        if vectors is None:
+            vectors = self.embed_chunks(chunks)
+
+        with self.lock:
+            if filename in self.files:
+                self.remove_file(filename)
+
+            chunk_ids = self.store.add(
+                [chunk.page_content for chunk in chunks], vectors, self._owner(filename)
+            ) if chunks else []
+            for chunk_id, chunk in zip(chunk_ids, chunks):
+                self.lexical_index.add(chunk_id, chunk.page_content)
+                self._chunk_metadata[chunk_id] = chunk.metadata
+
+            self.files[filename] = {
+                **file_info,
+                "chunk_ids": chunk_ids,
+                "chunk_metadata": [chunk.metadata for chunk in chunks]
+            }
+            self.version += 1
+
+    def add_chunks(self, filename: str, chunks: List[Document], vectors: List[List[float]]):
+        """Append a batch of chunks to a file being indexed incrementally, started with add_file(filename, {}, [])"""
+        with self.lock:
+            info = self.files[filename]
+            chunk_ids = self.store.add(
+                [chunk.page_content for chunk in chunks], vectors, self._owner(filename)
+            ) if chunks else []
+            for chunk_id, chunk in zip(chunk_ids, chunks):
+                self.lexical_index.add(chunk_id, chunk.page_content)
+                self._chunk_metadata[chunk_id] = chunk.metadata
+            info["chunk_ids"].extend(chunk_ids)
+            info["chunk_metadata"].extend(chunk.metadata for chunk in chunks)
+            self.version += 1
+
+    def finish_file(self, filename: str, file_info: Dict):
+        """Record a file's size, mtime and hash once all its chunks are in, so it is no longer seen as stale"""
+        with self.lock:
+            self.files[filename].update(file_info)
+
+    def remove_file(self, filename: str) -> bool:
+        """Remove a file's chunks from the conversation, returning False if it was not indexed"""
+        with self.lock:
+            info = self.files.get(filename)
+            if info is None:
+                return False
+            self.store.release(info["chunk_ids"], self._owner(filename))
+            self._forget(filename)
+            return True
+
+    def _forget(self, filename: str):
+        """Drop a file's chunks from the conversation's own indexes, leaving the store untouched"""
+        with self.lock:
+            info = self.files.pop(filename)
+            # The same chunk text may also appear in another of the conversation's files, which then
+            # supplies the chunk's metadata in place of the removed file's
+            still_used = {
+                chunk_id: metadata
+                for other in self.files.values()
+                for chunk_id, metadata in zip(other["chunk_ids"], other["chunk_metadata"])
+            }
+            unused = [chunk_id for chunk_id in info["chunk_ids"] if chunk_id not in still_used]
+            self.lexical_index.remove(unused)
+            for chunk_id in info["chunk_ids"]:
+                if chunk_id in still_used:
+                    self._chunk_metadata[chunk_id] = still_used[chunk_id]
+                else:
+                    self._chunk_metadata.pop(chunk_id, None)
+            self.version += 1
+
+    def _documents(self, chunk_ids: List[int]) -> List[Document]:
+        texts = self.store.get_texts(chunk_ids)
+        return [
+            Document(id=str(chunk_id), page_content=texts[chunk_id], metadata=self._chunk_metadata.get(chunk_id, {}))
+            for chunk_id in chunk_ids if chunk_id in texts
+        ]
+
+    def search_by_vector(self, embedding: List[float], k: int = 5) -> List[Document]:
+        with self.lock:
+            hits = self.store.search(embedding, k, self.chunk_ids())
+            return self._documents([chunk_id for chunk_id, _ in hits])
+
+    def lexical_search(self, query: str, k: int = 5) -> List[Document]:
+        """Return the k chunks that score highest for the query's terms under BM25"""
+        with self.lock:
+            return self._documents([chunk_id for chunk_id, _ in self.lexical_index.search(query, k)])
+
+    def hybrid_search(self, query: str, embedding: List[float], k: int = 5, fetch_k: int = 20) -> List[Document]:
+        """Fuse dense and BM25 rankings with reciprocal rank fusion, so exact identifiers aren't lost"""
+        fetch_k = max(fetch_k, k)
+        with self.lock:
+            dense = self.search_by_vector(embedding, fetch_k)
+            lexical = self.lexical_search(query, fetch_k)
+
+        scores: Dict[str, float] = {}
+        docs: Dict[str, Document] = {}
+        for ranking in (dense, lexical):
+            for rank, doc in enumerate(ranking):
+                key = doc.id or doc.page_content
+                scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+                docs[key] = doc
+        best = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [docs[key] for key in best]
+
+    def retrieve(self, query: str, embedding: Optional[List[float]], k: int = 5,
+                 mode: str = "dense") -> List[Document]:
+        """Search with one of RETRIEVAL_MODES; the lexical mode doesn't need an embedding"""
+        if mode == "lexical":
+            return self.lexical_search(query, k)
+        if mode == "hybrid":
+            return self.hybrid_search(query, embedding, k)
+        return self.search_by_vector(embedding, k)
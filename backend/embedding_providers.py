@@ -0,0 +1,109 @@
+import hashlib
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import httpx
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from lexical_index import tokenize
+
+EMBEDDING_PROVIDERS = ("openai", "sentence-transformers", "hashing")
+DEFAULT_EMBEDDING_MODELS = {
+    "openai": "text-embedding-ada-002",
+    "sentence-transformers": "all-MiniLM-L6-v2",
+    "hashing": "hashing-1024"
+}
+# Providers that call a rate-limited remote API rather than running on this machine
+REMOTE_PROVIDERS = ("openai",)
+
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """Local CPU embeddings from a sentence-transformers model (optional dependency)"""
+
+    def __init__(self, model: str, batch_size: int = 32):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "EMBEDDING_PROVIDER=sentence-transformers needs `pip install sentence-transformers`"
+            ) from e
+        self.model = model
+        self.batch_size = batch_size
+        self.client = SentenceTransformer(model, device="cpu")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Unit length, so the index's L2 ranking matches cosine similarity
+        vectors = self.client.encode(texts, batch_size=self.batch_size, normalize_embeddings=True,
+                                     convert_to_numpy=True, show_progress_bar=False)
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+@lru_cache(maxsize=100000)
+def _hash_token(token: str) -> Tuple[int, float]:
+    digest = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+    return digest >> 1, 1.0 if digest & 1 else -1.0
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Dependency-free embeddings: words, identifier parts and word pairs hashed
+    into a fixed number of signed buckets, with sublinear term weights. Only
+    as good as lexical overlap, but instant and offline, which suits tests
+    and air-gapped deployments.
+    """
+
+    def __init__(self, dimension: int = 1024):
+        self.dimension = dimension
+        self.model = f"hashing-{dimension}"
+
+    def _embed(self, text: str) -> List[float]:
+        tokens = tokenize(text)
+        features = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+        counts = {}
+        for feature in features:
+            counts[feature] = counts.get(feature, 0) + 1
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for feature, count in counts.items():
+            bucket, sign = _hash_token(feature)
+            vector[bucket % self.dimension] += sign * (1.0 + np.log(count))
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def create_embeddings(provider: str, model: Optional[str] = None, http_client: Optional[httpx.Client] = None,
+                      http_async_client: Optional[httpx.AsyncClient] = None) -> Embeddings:
+    """
+    Build one of EMBEDDING_PROVIDERS; model defaults to DEFAULT_EMBEDDING_MODELS[provider].
+    Remote providers send their requests through the given HTTP clients if any.
+    """
+    if provider not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"Unknown embedding provider {provider!r}, expected one of {', '.join(EMBEDDING_PROVIDERS)}")
+    model = model or DEFAULT_EMBEDDING_MODELS[provider]
+    if provider == "openai":
+        # Retries and rate limiting, for queries and documents alike, are left to the EmbeddingScheduler
+        return OpenAIEmbeddings(model=model, max_retries=0, http_client=http_client,
+                                http_async_client=http_async_client)
+    if provider == "sentence-transformers":
+        return SentenceTransformerEmbeddings(model)
+    match = re.fullmatch(r"hashing-(\d+)", model)
+    if match is None:
+        raise ValueError(f"Hashing embedding model must look like hashing-<dimension>, got {model!r}")
+    return HashingEmbeddings(int(match.group(1)))
+
+
+def embedding_store_name(provider: str, model: str) -> str:
+    """Directory-safe name for a provider and model, so vectors from different models never mix"""
+    name = model if model.startswith(provider) else f"{provider}-{model}"
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", name)
@@ -0,0 +1,331 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+import openai
+from langchain_core.embeddings import Embeddings
+
+# Status codes worth retrying: rate limited, timed out, conflicting, or a server-side failure
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for rate budgeting (~4 characters per token for English text)"""
+    return len(text) // 4 + 1
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait, from a Retry-After header"""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Tokens-per-minute budget; acquire() blocks until the tokens are available"""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = tokens_per_minute
+        self.rate = tokens_per_minute / 60.0
+        self.tokens = float(tokens_per_minute)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        if self.capacity <= 0:
+            # No budget configured
+            return
+        # A batch larger than the whole budget waits for a full bucket rather than forever
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class _Request:
+    """One embed() call waiting for its texts to come back from one or more batches"""
+
+    def __init__(self, size: int):
+        self.vectors: List[Optional[List[float]]] = [None] * size
+        self.remaining = size
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+
+
+class _Item:
+    __slots__ = ("request", "position", "text", "tokens", "queued_at")
+
+    def __init__(self, request: _Request, position: int, text: str):
+        self.request = request
+        self.position = position
+        self.text = text
+        self.tokens = estimate_tokens(text)
+        self.queued_at = time.monotonic()
+
+
+class EmbeddingScheduler:
+    """
+    Shared queue for document embeddings. Texts from concurrent ingestions are
+    coalesced into batches of up to max_batch_size texts / max_batch_tokens
+    tokens, at most max_concurrency batches are in flight, every batch draws
+    on a tokens-per-minute budget, and rate-limited or failed batches are
+    retried with exponential backoff. A 429 pauses all workers, so a burst of
+    rejections doesn't turn into a burst of retries. Queries skip the queue
+    and are embedded in the caller's thread, but get the same retries and
+    respect the same pause.
+    """
+
+    def __init__(self, embeddings_factory: Callable[[], Embeddings], max_batch_size: int = 512,
+                 max_batch_tokens: int = 100000, max_concurrency: int = 4, tokens_per_minute: int = 1000000,
+                 max_retries: int = 6, max_wait: float = 0.05, backoff: float = 1.0, max_backoff: float = 60.0):
+        self.embeddings_factory = embeddings_factory
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        # How long a partial batch waits for texts from other ingestions before it is sent
+        self.max_wait = max_wait
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = TokenBucket(tokens_per_minute)
+
+        self._embeddings: Optional[Embeddings] = None
+        self._embeddings_lock = threading.Lock()
+        self._queue: Deque[_Item] = deque()
+        self._queued_tokens = 0
+        self._condition = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._paused_until = 0.0
+        self._closed = False
+        self._stats = {"texts": 0, "batches": 0, "tokens": 0, "retries": 0, "rate_limited": 0, "failed_batches": 0,
+                       "queries": 0}
+
+    @property
+    def embeddings(self) -> Embeddings:
+        """The underlying client, created on first use"""
+        with self._embeddings_lock:
+            if self._embeddings is None:
+                self._embeddings = self.embeddings_factory()
+            return self._embeddings
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts through the shared queue, blocking until every one has a vector"""
+        if not texts:
+            return []
+        request = _Request(len(texts))
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Embedding scheduler is closed")
+            self._start_workers()
+            for position, text in enumerate(texts):
+                item = _Item(request, position, text)
+                self._queue.append(item)
+                self._queued_tokens += item.tokens
+            self._condition.notify_all()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a search query right away, retrying like a batch"""
+        attempt = 0
+        while True:
+            self._wait_if_paused()
+            try:
+                vector = self.embeddings.embed_query(text)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._count_query()
+            return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._pause_remaining())
+            try:
+                vector = await self.embeddings.aembed_query(text)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self._count_query()
+            return vector
+
+    def close(self):
+        """Stop the workers once their current batches finish, failing anything still queued"""
+        with self._condition:
+            self._closed = True
+            error = RuntimeError("Embedding scheduler is closed")
+            while self._queue:
+                self._finish(self._queue.popleft(), error=error)
+            self._queued_tokens = 0
+            self._condition.notify_all()
+
+    def stats(self) -> Dict:
+        with self._condition:
+            batches = self._stats["batches"]
+            return {
+                **self._stats,
+                "queued": len(self._queue),
+                "average_batch_size": self._stats["texts"] / batches if batches else 0.0,
+                "max_concurrency": self.max_concurrency,
+                "tokens_per_minute": self.budget.capacity
+            }
+
+    def _start_workers(self):
+        while len(self._workers) < self.max_concurrency:
+            worker = threading.Thread(target=self._run, name="embedding-scheduler", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            error, vectors = None, []
+            try:
+                vectors = self._embed_batch([item.text for item in batch], sum(item.tokens for item in batch))
+            except Exception as e:
+                error = e
+            with self._condition:
+                if error is not None:
+                    self._stats["failed_batches"] += 1
+                for position, item in enumerate(batch):
+                    self._finish(item, vector=vectors[position] if error is None else None, error=error)
+
+    @staticmethod
+    def _finish(item: _Item, vector: Optional[List[float]] = None, error: Optional[Exception] = None):
+        # Called with the condition held; a request's texts may be spread over several batches
+        request = item.request
+        if error is not None:
+            request.error = error
+        request.vectors[item.position] = vector
+        request.remaining -= 1
+        if request.remaining == 0:
+            request.done.set()
+
+    def _next_batch(self) -> Optional[List[_Item]]:
+        """Wait for a full batch, or for the oldest queued text to have waited max_wait, then take a batch"""
+        with self._condition:
+            while True:
+                if self._closed:
+                    return None
+                if self._queue:
+                    wait = self._queue[0].queued_at + self.max_wait - time.monotonic()
+                    full = len(self._queue) >= self.max_batch_size or self._queued_tokens >= self.max_batch_tokens
+                    if full or wait <= 0:
+                        break
+                    self._condition.wait(wait)
+                else:
+                    self._condition.wait()
+
+            batch, tokens = [], 0
+            while self._queue and len(batch) < self.max_batch_size:
+                # Always take at least one text, even if it alone exceeds max_batch_tokens
+                if batch and tokens + self._queue[0].tokens > self.max_batch_tokens:
+                    break
+                item = self._queue.popleft()
+                batch.append(item)
+                tokens += item.tokens
+            self._queued_tokens -= tokens
+            return batch
+
+    def _embed_batch(self, texts: List[str], tokens: int) -> List[List[float]]:
+        attempt = 0
+        while True:
+            self._wait_if_paused()
+            self.budget.acquire(tokens)
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            with self._condition:
+                self._stats["texts"] += len(texts)
+                self._stats["batches"] += 1
+                self._stats["tokens"] += tokens
+            return vectors
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying after error, or None if it shouldn't be retried"""
+        if not is_retryable(error) or attempt >= self.max_retries:
+            return None
+        delay = retry_after(error)
+        if delay is None:
+            # Full jitter, so workers that failed together don't retry together
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        with self._condition:
+            self._stats["retries"] += 1
+            if getattr(error, "status_code", None) == 429:
+                self._stats["rate_limited"] += 1
+                # Everyone backs off, not just the worker that was rejected
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    def _count_query(self):
+        with self._condition:
+            self._stats["queries"] += 1
+
+    def _pause_remaining(self) -> float:
+        with self._condition:
+            return max(0.0, self._paused_until - time.monotonic())
+
+    def _wait_if_paused(self):
+        while True:
+            wait = self._pause_remaining()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+class ScheduledEmbeddings(Embeddings):
+    """Embeddings that send documents through an EmbeddingScheduler's queue and queries through its retries"""
+
+    def __init__(self, scheduler: EmbeddingScheduler):
+        self.scheduler = scheduler
+
+    @property
+    def model(self) -> str:
+        embeddings = self.scheduler.embeddings
+        return getattr(embeddings, "model", type(embeddings).__name__)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.scheduler.embed(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.scheduler.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.scheduler.aembed_query(text)
@@ -0,0 +1,43 @@
+import hashlib
+from typing import List, Tuple
+
+from pypdf import PdfReader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain.schema import Document
+
+from page_cache import PageTexts
+
+# Functions in this module run inside the ingestion process pool, so they
+# must stay importable at module level and return picklable results.
+
+text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+
+def pdf_page_count(file_path: str) -> int:
+    """Number of pages, read from the PDF's page tree without extracting any text"""
+    return len(PdfReader(file_path).pages)
+
+def page_documents(file_path: str, pages: PageTexts, start: int = 0) -> List[Document]:
+    """One document per page, with the same metadata PyPDFLoader produces"""
+    return [
+        Document(page_content=text, metadata={"source": file_path, "page": start + offset, "page_label": label})
+        for offset, (text, label) in enumerate(pages)
+    ]
+
+def parse_page_range(file_path: str, start: int, stop: int) -> Tuple[PageTexts, List[Document]]:
+    """Extract pages [start, stop) and split them, so each range's chunks are ready as soon as it is parsed"""
+    reader = PdfReader(file_path)
+    labels = reader.page_labels
+    pages = [(reader.pages[number].extract_text(), labels[number]) for number in range(start, stop)]
+    return pages, split_pages(page_documents(file_path, pages, start))
+
+def split_pages(pages: List[Document]) -> List[Document]:
+    """Split parsed pages into chunks for embedding"""
+    return text_splitter.split_documents(pages)
+
+def file_sha256(file_path: str) -> str:
+    """Content hash of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,107 @@
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from telemetry import RequestTimings
+
+
+class FileProgress:
+    """Progress of a single file: queued -> chunked <-> embedded (per page range) -> indexed (or failed)"""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.stage = "queued"
+        self.pages = 0
+        self.chunks = 0
+        self.error: Optional[str] = None
+        self.updated_at = time.time()
+
+    def advance(self, stage: str, **counts):
+        self.stage = stage
+        for key, value in counts.items():
+            setattr(self, key, value)
+        self.updated_at = time.time()
+
+    def to_dict(self) -> Dict:
+        return {
+            "filename": self.filename,
+            "stage": self.stage,
+            "pages": self.pages,
+            "chunks": self.chunks,
+            "error": self.error
+        }
+
+
+class IngestionJob:
+    """A batch of uploaded files being indexed in the background"""
+
+    def __init__(self, conversation_id: str, filenames: List[str]):
+        self.job_id = str(uuid.uuid4())
+        self.conversation_id = conversation_id
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.files: Dict[str, FileProgress] = {name: FileProgress(name) for name in filenames}
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Spans recorded while the job runs, set when it starts
+        self.timings: Optional[RequestTimings] = None
+
+    def start(self):
+        self.status = "running"
+        self.started_at = time.time()
+
+    def finish(self, error: Optional[str] = None):
+        self.status = "failed" if error else "completed"
+        self.error = error
+        self.finished_at = time.time()
+        for progress in self.files.values():
+            if error and progress.stage != "indexed":
+                progress.advance("failed", error=error)
+            elif progress.stage == "queued":
+                # Not a PDF, or unchanged since it was last indexed
+                progress.advance("skipped")
+
+    def to_dict(self) -> Dict:
+        pages = sum(progress.pages for progress in self.files.values())
+        chunks = sum(progress.chunks for progress in self.files.values())
+        elapsed = 0.0
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.job_id,
+            "conversation_id": self.conversation_id,
+            "status": self.status,
+            "error": self.error,
+            "files": [progress.to_dict() for progress in self.files.values()],
+            "files_indexed": sum(1 for progress in self.files.values() if progress.stage == "indexed"),
+            "total_files": len(self.files),
+            "pages": pages,
+            "chunks": chunks,
+            "elapsed_seconds": round(elapsed, 3),
+            "pages_per_second": round(pages / elapsed, 2) if elapsed else 0.0,
+            "chunks_per_second": round(chunks / elapsed, 2) if elapsed else 0.0
+        }
+
+
+class JobRegistry:
+    """In-memory registry of recent ingestion jobs"""
+
+    def __init__(self, max_jobs: int = 1000):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+
+    def create(self, conversation_id: str, filenames: List[str]) -> IngestionJob:
+        job = IngestionJob(conversation_id, filenames)
+        self._jobs[job.job_id] = job
+        # Forget the oldest jobs so the registry doesn't grow without bound
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+        return job
+
+    def get(self, conversation_id: str, job_id: str) -> Optional[IngestionJob]:
+        job = self._jobs.get(job_id)
+        if job is None or job.conversation_id != conversation_id:
+            return None
+        return job
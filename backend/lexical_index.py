@@ -0,0 +1,90 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from operator import itemgetter
+from typing import Dict, List, Tuple
+
+# Keeps identifiers such as "AB-1234", "4.2.1" or "ERR_502" together as one token
+_TOKEN = re.compile(r"\w+(?:[-./:]\w+)*")
+_SEPARATORS = re.compile(r"[-./:_]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; compound identifiers are indexed whole and by their parts"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        tokens.append(token)
+        parts = [part for part in _SEPARATORS.split(token) if part]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class LexicalIndex:
+    """In-memory BM25 inverted index over a conversation's chunks, keyed by chunk ID"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # chunk ID -> term frequencies; the postings below are derived from it
+        self.documents: Dict[int, Dict[str, int]] = {}
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.lengths: Dict[int, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add(self, chunk_id: int, text: str):
+        self._add_counts(chunk_id, dict(Counter(tokenize(text))))
+
+    def _add_counts(self, chunk_id: int, counts: Dict[str, int]):
+        # Re-adding a chunk replaces its counts
+        self.remove([chunk_id])
+        self.documents[chunk_id] = counts
+        for term, frequency in counts.items():
+            self.postings[term][chunk_id] = frequency
+        length = sum(counts.values())
+        self.lengths[chunk_id] = length
+        self.total_length += length
+
+    def remove(self, chunk_ids: List[int]):
+        for chunk_id in chunk_ids:
+            counts = self.documents.pop(chunk_id, None)
+            if counts is None:
+                continue
+            for term in counts:
+                postings = self.postings[term]
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self.postings[term]
+            self.total_length -= self.lengths.pop(chunk_id)
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[int, float]]:
+        """Return up to k (chunk ID, BM25 score) pairs, best first"""
+        if not self.documents:
+            return []
+        count = len(self.documents)
+        average_length = self.total_length / count or 1.0
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / average_length)
+                scores[chunk_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return heapq.nlargest(k, scores.items(), key=itemgetter(1))
+
+    def to_dict(self) -> Dict:
+        # A list of pairs, since JSON object keys can't be integers
+        return {"documents": list(self.documents.items())}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "LexicalIndex":
+        index = cls()
+        for chunk_id, counts in data["documents"]:
+            index._add_counts(chunk_id, counts)
+        return index
@@ -0,0 +1,72 @@
+import threading
+from typing import Dict, Tuple
+
+import httpx
+from langchain_core.embeddings import Embeddings
+from langchain_openai import ChatOpenAI
+from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+
+from embedding_providers import create_embeddings
+from telemetry import LLMCallTelemetry
+
+
+class ClientRegistry:
+    """
+    Process-wide chat model and embedding clients. Every OpenAI client shares
+    one keep-alive connection pool for sync calls and one for async calls, so
+    a conversation's first request reuses connections already open rather
+    than paying for a new TLS handshake. The clients hold no per-conversation
+    state, so one per model serves every conversation.
+    """
+
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 60.0):
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.http_client = DefaultHttpxClient(limits=limits)
+        self.http_async_client = DefaultAsyncHttpxClient(limits=limits)
+        self._chat_models: Dict[Tuple[str, float], ChatOpenAI] = {}
+        self._embeddings: Dict[Tuple[str, str], Embeddings] = {}
+        self._lock = threading.Lock()
+        self.telemetry = LLMCallTelemetry()
+
+    def chat_model(self, model: str, temperature: float = 0.0) -> ChatOpenAI:
+        key = (model, temperature)
+        with self._lock:
+            llm = self._chat_models.get(key)
+            if llm is None:
+                llm = ChatOpenAI(
+                    model_name=model,
+                    temperature=temperature,
+                    http_client=self.http_client,
+                    http_async_client=self.http_async_client,
+                    # Streamed calls report token usage too, so cached prompt tokens are always counted
+                    stream_usage=True,
+                    callbacks=[self.telemetry]
+                )
+                self._chat_models[key] = llm
+            return llm
+
+    def embeddings(self, provider: str, model: str) -> Embeddings:
+        key = (provider, model)
+        with self._lock:
+            embeddings = self._embeddings.get(key)
+            if embeddings is None:
+                embeddings = create_embeddings(provider, model, self.http_client, self.http_async_client)
+                self._embeddings[key] = embeddings
+            return embeddings
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "chat_models": [f"{model}@{temperature}" for model, temperature in self._chat_models],
+                "embeddings": [f"{provider}/{model}" for provider, model in self._embeddings],
+                "prompt_cache": self.telemetry.prompt_cache_stats()
+            }
+
+    async def aclose(self):
+        self.http_client.close()
+        await self.http_async_client.aclose()
@@ -0,0 +1,103 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# (text, page label) for each page of a PDF, in page order
+PageTexts = List[Tuple[str, str]]
+
+
+class PageTextCache:
+    """
+    Persistent LRU cache of extracted PDF page text keyed by file SHA-256.
+    Pages are written and read a range at a time, so a large file never has
+    to be held in memory whole; a file only counts as cached once all of its
+    pages are stored.
+    """
+
+    def __init__(self, path: str, max_files: int = 1000):
+        self.path = path
+        self.max_files = max_files
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "sha256 TEXT PRIMARY KEY, page_count INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_pages ("
+            "sha256 TEXT NOT NULL, page INTEGER NOT NULL, text TEXT NOT NULL, label TEXT NOT NULL, "
+            "PRIMARY KEY (sha256, page))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_last_used ON files (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def page_count(self, sha256: str) -> Optional[int]:
+        """Number of pages if the file was fully parsed before, marking it as recently used"""
+        with self._lock:
+            row = self._conn.execute("SELECT page_count FROM files WHERE sha256 = ?", (sha256,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE files SET last_used = ? WHERE sha256 = ?", (time.time(), sha256))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def get_pages(self, sha256: str, start: int, stop: int) -> PageTexts:
+        """Text and label of pages [start, stop); fewer pages if the file was evicted since page_count()"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT text, label FROM file_pages WHERE sha256 = ? AND page >= ? AND page < ? ORDER BY page",
+                (sha256, start, stop)
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def put_pages(self, sha256: str, start: int, pages: PageTexts):
+        """Store the pages of a file starting at page `start`"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO file_pages (sha256, page, text, label) VALUES (?, ?, ?, ?)",
+                [(sha256, start + offset, text, label) for offset, (text, label) in enumerate(pages)]
+            )
+            self._conn.commit()
+
+    def complete(self, sha256: str, page_count: int):
+        """Mark a file's pages as all stored and evict the least recently used files beyond max_files"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO files (sha256, page_count, last_used) VALUES (?, ?, ?)",
+                (sha256, page_count, time.time())
+            )
+            self._size += cursor.rowcount
+            overflow = self._size - self.max_files
+            if overflow > 0:
+                evicted = [row[0] for row in self._conn.execute(
+                    "SELECT sha256 FROM files ORDER BY last_used ASC LIMIT ?", (overflow,)
+                )]
+                self._conn.executemany("DELETE FROM files WHERE sha256 = ?", [(key,) for key in evicted])
+                self._conn.executemany("DELETE FROM file_pages WHERE sha256 = ?", [(key,) for key in evicted])
+                self._size -= overflow
+                self.evictions += overflow
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "files": self._size,
+                "max_files": self.max_files,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,162 @@
+import math
+from typing import List, Optional, Protocol, Set
+
+from langchain_core.documents import Document
+
+from embedding_scheduler import estimate_tokens
+from lexical_index import tokenize
+
+RERANKERS = ("lexical", "cross-encoder", "none")
+
+
+class Scorer(Protocol):
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        """Relevance of each document to the query, higher is better; documents arrive in retrieval order"""
+        ...
+
+
+class LexicalScorer:
+    """
+    Share of the query's terms each chunk contains, each term weighted by how
+    rare it is among the candidates, blended with the chunk's retrieval rank.
+    Cheap enough to run on every tool call.
+    """
+
+    def __init__(self, rank_weight: float = 0.3):
+        self.rank_weight = rank_weight
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        terms = set(tokenize(query))
+        chunk_terms = [set(tokenize(doc.page_content)) for doc in documents]
+        count = len(documents)
+        weights = {
+            term: math.log(1 + count / (0.5 + sum(1 for found in chunk_terms if term in found)))
+            for term in terms
+        }
+        total = sum(weights.values()) or 1.0
+        scores = []
+        for rank, found in enumerate(chunk_terms):
+            coverage = sum(weight for term, weight in weights.items() if term in found) / total
+            scores.append((1 - self.rank_weight) * coverage + self.rank_weight * (1 - rank / count))
+        return scores
+
+
+class CrossEncoderScorer:
+    """Query/chunk relevance from a local sentence-transformers cross-encoder (optional dependency)"""
+
+    def __init__(self, model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError("RERANKER=cross-encoder needs `pip install sentence-transformers`") from e
+        self.model = CrossEncoder(model, device="cpu")
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        return self.model.predict([(query, doc.page_content) for doc in documents]).tolist()
+
+
+def create_scorer(name: str, model: Optional[str] = None) -> Optional[Scorer]:
+    """Build one of RERANKERS; "none" keeps the retrieval order"""
+    if name not in RERANKERS:
+        raise ValueError(f"Unknown reranker {name!r}, expected one of {', '.join(RERANKERS)}")
+    if name == "lexical":
+        return LexicalScorer()
+    if name == "cross-encoder":
+        return CrossEncoderScorer(model) if model else CrossEncoderScorer()
+    return None
+
+
+def _shingles(text: str, size: int = 3) -> Set[str]:
+    words = text.lower().split()
+    return {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def _overlap(first: str, second: str, min_overlap: int, max_overlap: int) -> int:
+    """Length of the longest suffix of `first` that starts `second`, as the splitter's chunk_overlap leaves"""
+    for length in range(min(len(first), len(second), max_overlap), min_overlap - 1, -1):
+        if first.endswith(second[:length]):
+            return length
+    return 0
+
+
+class Reranker:
+    """
+    Post-processes Document Search candidates: drops near-duplicates, re-ranks
+    what is left with a pluggable scorer, and packs the best chunks into a
+    token budget rather than returning a fixed k. A chunk that overlaps one
+    already picked (neighbours from the splitter share chunk_overlap
+    characters) is merged into it, so the shared text is only paid for once.
+    """
+
+    def __init__(self, scorer: Optional[Scorer], fetch_k: int = 20, token_budget: int = 1200,
+                 max_results: int = 8, duplicate_threshold: float = 0.8, min_overlap: int = 20,
+                 max_overlap: int = 400):
+        self.scorer = scorer
+        # Candidates fetched from the index per search
+        self.fetch_k = fetch_k
+        self.token_budget = token_budget
+        self.max_results = max_results
+        # Share of a chunk's word 3-grams already in a picked chunk above which it is a duplicate
+        self.duplicate_threshold = duplicate_threshold
+        self.min_overlap = min_overlap
+        self.max_overlap = max_overlap
+
+    def rerank(self, query: str, documents: List[Document]) -> List[Document]:
+        candidates = self._dedupe(documents)
+        if self.scorer is not None and len(candidates) > 1:
+            scores = self.scorer.score(query, candidates)
+            order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+            candidates = [candidates[i] for i in order]
+        return self._pack(candidates)
+
+    def _dedupe(self, documents: List[Document]) -> List[Document]:
+        kept, kept_shingles = [], []
+        for doc in documents:
+            shingles = _shingles(doc.page_content)
+            if any(len(shingles & other) >= self.duplicate_threshold * len(shingles) for other in kept_shingles):
+                continue
+            kept.append(doc)
+            kept_shingles.append(shingles)
+        return kept
+
+    def _pack(self, candidates: List[Document]) -> List[Document]:
+        picked: List[Document] = []
+        used = 0
+        for doc in candidates:
+            if len(picked) >= self.max_results:
+                break
+            merged = self._merge(picked, doc, self.token_budget - used)
+            if merged is not None:
+                if merged:
+                    used = sum(estimate_tokens(picked_doc.page_content) for picked_doc in picked)
+                continue
+            tokens = estimate_tokens(doc.page_content)
+            # The best chunk always goes in, even if it alone is over budget
+            if picked and used + tokens > self.token_budget:
+                continue
+            picked.append(doc)
+            used += tokens
+        return picked
+
+    def _merge(self, picked: List[Document], doc: Document, remaining: int) -> Optional[bool]:
+        """
+        Join doc onto a picked chunk from the same page that it overlaps. Returns
+        None if it overlaps none of them, False if the merged text wouldn't fit.
+        """
+        for position, other in enumerate(picked):
+            if other.metadata.get("source") != doc.metadata.get("source") or \
+                    other.metadata.get("page") != doc.metadata.get("page"):
+                continue
+            overlap = _overlap(other.page_content, doc.page_content, self.min_overlap, self.max_overlap)
+            if overlap:
+                merged = other.page_content + doc.page_content[overlap:]
+            else:
+                overlap = _overlap(doc.page_content, other.page_content, self.min_overlap, self.max_overlap)
+                if not overlap:
+                    continue
+                merged = doc.page_content + other.page_content[overlap:]
+            if estimate_tokens(merged) - estimate_tokens(other.page_content) > remaining:
+                return False
+            picked[position] = Document(id=other.id, page_content=merged, metadata=other.metadata)
+            return True
+        return None
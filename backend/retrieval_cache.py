@@ -0,0 +1,153 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar, copy_context
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from document_index import DocumentIndex
+from embedding_scheduler import estimate_tokens
+from reranking import Reranker
+from telemetry import span
+
+
+class RetrievalStats:
+    """Document Search usage during a single chat request"""
+
+    def __init__(self):
+        self.tool_calls = 0
+        # Searches run by the direct/auto router rather than by the agent
+        self.routing_searches = 0
+        self.cache_hits = 0
+        self.embedding_cache_hits = 0
+        # Estimated prompt tokens of the chunks handed back to the agent
+        self.result_tokens = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            "tool_calls": self.tool_calls,
+            "routing_searches": self.routing_searches,
+            "cache_hits": self.cache_hits,
+            "embedding_cache_hits": self.embedding_cache_hits,
+            "result_tokens": self.result_tokens
+        }
+
+
+# Set per chat request so the tool can report into it
+retrieval_stats: ContextVar[Optional[RetrievalStats]] = ContextVar("retrieval_stats", default=None)
+
+
+class CachedRetriever:
+    """
+    Memoizes a conversation's Document Search calls. Query embeddings are kept
+    for as long as they fit; top-k results are dropped whenever the underlying
+    index changes. With a reranker, reranker.fetch_k candidates are retrieved
+    and the reranked, token-packed results are what gets cached.
+    """
+
+    def __init__(self, document_index: DocumentIndex, max_entries: int = 256, mode: str = "dense",
+                 reranker: Optional[Reranker] = None):
+        self.document_index = document_index
+        self.mode = mode
+        self.reranker = reranker
+        self.max_entries = max_entries
+        self._embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._results: "OrderedDict[Tuple[str, int], List[Document]]" = OrderedDict()
+        self._results_version = document_index.version
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(query: str) -> str:
+        # The agent often repeats a query with different casing or spacing
+        return " ".join(query.lower().split())
+
+    def _get(self, cache: OrderedDict, key):
+        with self._lock:
+            if cache is self._results and self._results_version != self.document_index.version:
+                self._results.clear()
+                self._results_version = self.document_index.version
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _put(self, cache: OrderedDict, key, value, version: Optional[int] = None):
+        with self._lock:
+            # Don't keep results computed against an index that changed mid-search
+            if version is not None and version != self.document_index.version:
+                return
+            cache[key] = value
+            while len(cache) > self.max_entries:
+                cache.popitem(last=False)
+
+    def _record(self, stat: str, amount: int = 1):
+        stats = retrieval_stats.get()
+        if stats is not None:
+            setattr(stats, stat, getattr(stats, stat) + amount)
+
+    def _retrieve(self, query: str, embedding: Optional[List[float]], k: int) -> List[Document]:
+        if self.reranker is None:
+            with span("retrieval"):
+                return self.document_index.retrieve(query, embedding, k, self.mode)
+        with span("retrieval"):
+            candidates = self.document_index.retrieve(query, embedding, self.reranker.fetch_k, self.mode)
+        with span("rerank"):
+            return self.reranker.rerank(query, candidates)
+
+    def _returned(self, results: List[Document]) -> List[Document]:
+        self._record("result_tokens", sum(estimate_tokens(doc.page_content) for doc in results))
+        return results
+
+    def embed_query(self, query: str) -> List[float]:
+        """The query's embedding, memoized so a query is embedded once however often it is searched"""
+        key = self._normalize(query)
+        embedding = self._get(self._embeddings, key)
+        if embedding is not None:
+            self._record("embedding_cache_hits")
+            return embedding
+        with span("query_embedding"):
+            embedding = self.document_index.embeddings.embed_query(query)
+        self._put(self._embeddings, key, embedding)
+        return embedding
+
+    async def aembed_query(self, query: str) -> List[float]:
+        key = self._normalize(query)
+        embedding = self._get(self._embeddings, key)
+        if embedding is not None:
+            self._record("embedding_cache_hits")
+            return embedding
+        with span("query_embedding"):
+            embedding = await self.document_index.embeddings.aembed_query(query)
+        self._put(self._embeddings, key, embedding)
+        return embedding
+
+    def search(self, query: str, k: int = 5, count_as: str = "tool_calls") -> List[Document]:
+        self._record(count_as)
+        key = self._normalize(query)
+        results = self._get(self._results, (key, k))
+        if results is not None:
+            self._record("cache_hits")
+            return self._returned(results)
+
+        embedding = self.embed_query(query) if self.mode != "lexical" else None
+        version = self.document_index.version
+        results = self._retrieve(query, embedding, k)
+        self._put(self._results, (key, k), results, version)
+        return self._returned(results)
+
+    async def asearch(self, query: str, k: int = 5, count_as: str = "tool_calls") -> List[Document]:
+        self._record(count_as)
+        key = self._normalize(query)
+        results = self._get(self._results, (key, k))
+        if results is not None:
+            self._record("cache_hits")
+            return self._returned(results)
+
+        embedding = await self.aembed_query(query) if self.mode != "lexical" else None
+        version = self.document_index.version
+        loop = asyncio.get_running_loop()
+        # Carry the request's context into the thread, so its spans are attributed to it
+        results = await loop.run_in_executor(None, copy_context().run, self._retrieve, query, embedding, k)
+        self._put(self._results, (key, k), results, version)
+        return self._returned(results)
@@ -0,0 +1,68 @@
+"""
+Query-embedding latency per embedding provider.
+
+For each provider it times the first call (model load or connection setup,
+which the app's startup warmup absorbs), then the p50/p95 latency of
+embedding single Document Search queries and the throughput of embedding
+ingestion-sized batches of chunks. Providers that can't be created here
+(sentence-transformers not installed, no OpenAI key) are reported and skipped.
+
+    python scripts/embedding_provider_benchmark.py --providers hashing sentence-transformers openai
+    OPENAI_API_BASE=http://127.0.0.1:8100/v1 OPENAI_API_KEY=fake python scripts/embedding_provider_benchmark.py
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from embedding_providers import DEFAULT_EMBEDDING_MODELS, EMBEDDING_PROVIDERS, create_embeddings
+
+QUERIES = [
+    "What is the refund policy for damaged items?",
+    "torque setting for part AB-1234",
+    "Who approves travel expenses over the limit?",
+    "error ERR_502 after firmware update 4.2.1",
+    "summarize the safety requirements in section 3",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--providers", nargs="+", default=list(EMBEDDING_PROVIDERS), choices=EMBEDDING_PROVIDERS)
+    parser.add_argument("--queries", type=int, default=50, help="single-query calls timed per provider")
+    parser.add_argument("--chunks", type=int, default=100, help="chunks per document batch")
+    args = parser.parse_args()
+
+    chunk = "The replacement part must be torqued to the value in table 4 before the unit is powered on. " * 10
+    print(f"{'provider':<24}{'model':<26}{'first call s':>13}{'query p50 ms':>14}{'query p95 ms':>14}{'chunks/s':>10}")
+    for provider in args.providers:
+        model = DEFAULT_EMBEDDING_MODELS[provider]
+        try:
+            started = time.perf_counter()
+            embeddings = create_embeddings(provider, model)
+            embeddings.embed_query("warmup")
+            first_call = time.perf_counter() - started
+        except Exception as e:
+            print(f"{provider:<24}{model:<26}  skipped: {type(e).__name__}: {str(e)[:80]}")
+            continue
+
+        latencies = []
+        for i in range(args.queries):
+            started = time.perf_counter()
+            embeddings.embed_query(f"{QUERIES[i % len(QUERIES)]} ({i})")
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        embeddings.embed_documents([f"{i}: {chunk}" for i in range(args.chunks)])
+        throughput = args.chunks / (time.perf_counter() - started)
+
+        p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+        print(f"{provider:<24}{model:<26}{first_call:>13.2f}{p50:>14.2f}{p95:>14.2f}{throughput:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Concurrent-ingestion benchmark for the embedding scheduler.
+
+Starts the fake embedding server (scripts/fake_embedding_server.py) in-process
+with a tokens-per-minute limit and simulated latency, then has --uploads
+threads embed their chunks one page range at a time, as the ingestion
+pipeline does. It runs twice: once with each upload calling the OpenAI client
+directly (how embedding worked before the scheduler) and once through a
+shared EmbeddingScheduler. For each run it reports wall time, failed uploads,
+requests sent, 429s received and the average batch size. No API key is needed.
+
+    python scripts/embedding_scheduler_benchmark.py --uploads 8 --chunks 200 --tokens-per-minute 300000
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+import uvicorn
+from langchain_openai import OpenAIEmbeddings
+
+from embedding_scheduler import EmbeddingScheduler
+from fake_embedding_server import create_app
+
+
+def start_server(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_client(base_url: str, max_retries: int) -> OpenAIEmbeddings:
+    # Plain text inputs, so no tiktoken encoding has to be downloaded
+    return OpenAIEmbeddings(openai_api_base=base_url, openai_api_key="fake", max_retries=max_retries,
+                            check_embedding_ctx_length=False)
+
+
+def run_uploads(embed: Callable[[List[str]], List[List[float]]], uploads: int, chunks: int, batch: int) -> Dict:
+    """Each upload embeds its chunks a page range at a time; returns wall time and failed uploads"""
+    def upload(number: int):
+        texts = [f"upload {number} chunk {i} " + "lorem ipsum dolor sit amet " * 36 for i in range(chunks)]
+        for start in range(0, len(texts), batch):
+            vectors = embed(texts[start:start + batch])
+            assert len(vectors) == len(texts[start:start + batch])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=uploads) as pool:
+        futures = [pool.submit(upload, number) for number in range(uploads)]
+        failed = sum(1 for future in futures if future.exception() is not None)
+    return {"seconds": time.perf_counter() - started, "failed": failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=8, help="concurrent ingestions")
+    parser.add_argument("--chunks", type=int, default=200, help="chunks per upload (~250 tokens each)")
+    parser.add_argument("--range-chunks", type=int, default=100, help="chunks per page range, embedded in one call")
+    parser.add_argument("--tokens-per-minute", type=int, default=300000, help="server-side limit")
+    parser.add_argument("--latency", type=float, default=0.3, help="server seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="share of requests rejected with 429 at random")
+    parser.add_argument("--concurrency", type=int, default=4, help="scheduler requests in flight")
+    args = parser.parse_args()
+
+    print(f"{args.uploads} uploads x {args.chunks} chunks, server limit {args.tokens_per_minute} tokens/min, "
+          f"{args.latency}s latency, {args.error_rate:.0%} random 429s")
+    print(f"{'mode':<12}{'seconds':>9}{'failed':>8}{'requests':>10}{'429s':>7}{'texts/request':>15}")
+    for mode in ("direct", "scheduler"):
+        port = free_port()
+        server = start_server(create_app(latency=args.latency, tokens_per_minute=args.tokens_per_minute,
+                                         error_rate=args.error_rate), port)
+        base_url = f"http://127.0.0.1:{port}/v1"
+        try:
+            if mode == "direct":
+                # The OpenAI client's own defaults: two retries that honour Retry-After
+                client = make_client(base_url, max_retries=2)
+                result = run_uploads(client.embed_documents, args.uploads, args.chunks, args.range_chunks)
+            else:
+                scheduler = EmbeddingScheduler(
+                    lambda: make_client(base_url, max_retries=0),
+                    max_concurrency=args.concurrency,
+                    # Leave headroom for the estimate being off
+                    tokens_per_minute=int(args.tokens_per_minute * 0.9)
+                )
+                result = run_uploads(scheduler.embed, args.uploads, args.chunks, args.range_chunks)
+                scheduler.close()
+            stats = httpx.get(f"http://127.0.0.1:{port}/stats").json()
+        finally:
+            server.should_exit = True
+        rejected = stats["rate_limited"] + stats["random_429s"]
+        served = stats["requests"] - rejected
+        print(f"{mode:<12}{result['seconds']:>9.1f}{result['failed']:>8}{stats['requests']:>10}{rejected:>7}"
+              f"{stats['inputs'] / served if served else 0:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
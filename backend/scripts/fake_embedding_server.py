@@ -0,0 +1,129 @@
+"""
+Local stand-in for the OpenAI embeddings endpoint.
+
+Serves POST /v1/embeddings with deterministic vectors after a simulated
+network and compute delay, enforces a tokens-per-minute limit by answering
+429 (with a Retry-After header) once the budget is spent, and can reject a
+random share of requests with 429 besides. GET /stats reports what it served.
+Point the backend at it with OPENAI_API_BASE=http://127.0.0.1:8100/v1.
+
+    python scripts/fake_embedding_server.py --port 8100 --tokens-per-minute 200000 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import random
+import threading
+import time
+from typing import Dict, List, Union
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+class EmbeddingRequest(BaseModel):
+    input: Union[str, List[str], List[int], List[List[int]]]
+    model: str = "text-embedding-ada-002"
+    encoding_format: str = "float"
+
+
+def fake_vector(item: Union[str, List[int]], dimension: int) -> np.ndarray:
+    """Unit vector seeded by the input, so the same text always embeds the same way"""
+    seed = hashlib.sha256(repr(item).encode("utf-8")).digest()
+    vector = np.random.default_rng(int.from_bytes(seed[:8], "little")).normal(size=dimension)
+    return (vector / np.linalg.norm(vector)).astype(np.float32)
+
+
+def create_app(latency: float = 0.2, latency_per_1k_tokens: float = 0.01, tokens_per_minute: int = 1000000,
+               error_rate: float = 0.0, dimension: int = 1536, max_inputs: int = 2048) -> FastAPI:
+    app = FastAPI(title="Fake embedding server")
+    lock = threading.Lock()
+    budget = {"tokens": float(tokens_per_minute), "updated_at": time.monotonic()}
+    stats: Dict[str, float] = {"requests": 0, "inputs": 0, "tokens": 0, "rate_limited": 0, "random_429s": 0, "max_inputs": 0}
+
+    def rate_limited(tokens: int):
+        """Spend tokens from the per-minute budget, or return how long until there would be enough"""
+        with lock:
+            now = time.monotonic()
+            budget["tokens"] = min(tokens_per_minute, budget["tokens"] + (now - budget["updated_at"]) * tokens_per_minute / 60)
+            budget["updated_at"] = now
+            if budget["tokens"] >= tokens:
+                budget["tokens"] -= tokens
+                return None
+            return (tokens - budget["tokens"]) * 60 / tokens_per_minute
+
+    def rejection(message: str, retry_after: float = None) -> JSONResponse:
+        headers = {"retry-after": f"{retry_after:.3f}"} if retry_after is not None else {}
+        return JSONResponse(
+            status_code=429,
+            content={"error": {"message": message, "type": "rate_limit_exceeded", "code": "rate_limit_exceeded"}},
+            headers=headers
+        )
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: EmbeddingRequest):
+        inputs = request.input
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        if len(inputs) > max_inputs:
+            return JSONResponse(status_code=400, content={"error": {"message": f"Too many inputs (max {max_inputs})"}})
+        # Token arrays count exactly; text is estimated at ~4 characters per token
+        tokens = sum(len(item) if isinstance(item, list) else len(item) // 4 + 1 for item in inputs)
+
+        with lock:
+            stats["requests"] += 1
+        if random.random() < error_rate:
+            with lock:
+                stats["random_429s"] += 1
+            return rejection("Simulated rate limit")
+        wait = rate_limited(tokens)
+        if wait is not None:
+            with lock:
+                stats["rate_limited"] += 1
+            return rejection("Rate limit reached for tokens per min", retry_after=wait)
+
+        await asyncio.sleep(latency + latency_per_1k_tokens * tokens / 1000)
+        data = []
+        for index, item in enumerate(inputs):
+            vector = fake_vector(item, dimension)
+            embedding = base64.b64encode(vector.tobytes()).decode() if request.encoding_format == "base64" else vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        with lock:
+            stats["inputs"] += len(inputs)
+            stats["tokens"] += tokens
+            stats["max_inputs"] = max(stats["max_inputs"], len(inputs))
+        return {
+            "object": "list",
+            "data": data,
+            "model": request.model,
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        with lock:
+            return dict(stats)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per request")
+    parser.add_argument("--latency-per-1k-tokens", type=float, default=0.01, help="extra seconds per 1000 input tokens")
+    parser.add_argument("--tokens-per-minute", type=int, default=1000000, help="429 once this budget is spent")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests rejected with 429 at random")
+    parser.add_argument("--dimension", type=int, default=1536)
+    args = parser.parse_args()
+    app = create_app(args.latency, args.latency_per_1k_tokens, args.tokens_per_minute, args.error_rate, args.dimension)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
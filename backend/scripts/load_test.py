@@ -0,0 +1,126 @@
+"""
+Load test for the /chat endpoint against a stub LLM.
+
+Runs N concurrent chats through the app in-process, once with the agent
+executed synchronously inside the request (how /chat used to work) and once
+with the async agent path, and reports the throughput of each. The stub LLM
+sleeps for --latency seconds per call to stand in for an OpenAI round-trip,
+and embeddings are deterministic fakes, so no API key or network is needed.
+
+    python scripts/load_test.py --conversations 20 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import Any, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from langchain.agents import AgentExecutor
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+SEARCH_RESPONSE = '```json\n{"action": "Document Search", "action_input": "refund policy"}\n```'
+FINAL_RESPONSE = '```json\n{"action": "Final Answer", "action_input": "Refunds are issued within 30 days."}\n```'
+
+
+class StubChatModel(BaseChatModel):
+    """Chat model that searches once, then answers, sleeping to simulate network latency"""
+
+    latency: float = 0.5
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _respond(self, messages: List[BaseMessage]) -> ChatResult:
+        # The agent feeds tool output back as "TOOL RESPONSE", so answer once it has searched
+        searched = any("TOOL RESPONSE" in str(message.content) for message in messages)
+        message = AIMessage(content=FINAL_RESPONSE if searched else SEARCH_RESPONSE)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._respond(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._respond(messages)
+
+
+async def run_chats(app, conversation_ids: List[str]) -> float:
+    """Send one chat per conversation concurrently and return the wall-clock time"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post(f"/conversations/{conversation_id}/chat", json={"question": "What is the refund policy?"})
+            for conversation_id in conversation_ids
+        ])
+        elapsed = time.perf_counter() - start
+    for response in responses:
+        response.raise_for_status()
+        # /chat reports agent failures in the answer rather than the status code
+        assert not response.json()["answer"].startswith("An error occurred"), response.json()["answer"]
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=20, help="concurrent chats per run")
+    parser.add_argument("--latency", type=float, default=0.5, help="simulated seconds per LLM call")
+    args = parser.parse_args()
+
+    # api creates its storage relative to the working directory
+    os.chdir(tempfile.mkdtemp(prefix="load-test-"))
+    # Keep full-history memory so the run doesn't need tiktoken's encoding files
+    os.environ.setdefault("MEMORY_TOKEN_BUDGET", "0")
+    import api
+    import llm_clients
+    from document_index import DocumentIndex
+
+    llm_clients.ChatOpenAI = lambda **kwargs: StubChatModel(latency=args.latency, callbacks=kwargs.get("callbacks"))
+    embeddings = DeterministicFakeEmbedding(size=64)
+    chunks = [Document(page_content=f"Section {i}: refunds are issued within 30 days.") for i in range(50)]
+
+    conversation_ids = []
+    for _ in range(args.conversations):
+        conversation_id = api.conversation_manager.create_conversation(os.urandom(8).hex())
+        document_index = DocumentIndex(embeddings, api.vector_index)
+        document_index.add_file("policy.pdf", {}, chunks)
+        api.document_indexes[conversation_id] = document_index
+        api.agents[conversation_id] = api.create_chat_session(conversation_id, document_index)
+        conversation_ids.append(conversation_id)
+
+    # Reproduce the old endpoint by running the agent synchronously inside the request
+    async_invoke = AgentExecutor.ainvoke
+
+    async def blocking_invoke(self, input, *args, **kwargs):
+        return self.invoke(input, *args, **kwargs)
+
+    AgentExecutor.ainvoke = blocking_invoke
+    try:
+        sync_elapsed = asyncio.run(run_chats(api.app, conversation_ids))
+    finally:
+        AgentExecutor.ainvoke = async_invoke
+    async_elapsed = asyncio.run(run_chats(api.app, conversation_ids))
+
+    calls = 2 * args.conversations
+    print(f"{args.conversations} concurrent chats, {calls} LLM calls at {args.latency:.2f}s each")
+    print(f"  sync agent.invoke:   {sync_elapsed:6.2f}s  ({args.conversations / sync_elapsed:6.2f} chats/s)")
+    print(f"  async agent.ainvoke: {async_elapsed:6.2f}s  ({args.conversations / async_elapsed:6.2f} chats/s)")
+    print(f"  speedup: {sync_elapsed / async_elapsed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
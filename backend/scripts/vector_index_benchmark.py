@@ -0,0 +1,104 @@
+"""
+Recall-vs-memory benchmark for the shared vector index types.
+
+Builds a SharedVectorIndex over a synthetic clustered corpus for each index
+type, searches it through the filtered (large conversation) path, and reports
+recall@k against exact search, the in-memory bytes per vector and the median
+query latency, with and without the exact re-rank over k * rerank_factor
+candidates (by default the factor the index type uses in the app). No API
+key or network is needed.
+
+    python scripts/vector_index_benchmark.py --vectors 20000 --types flat fp16 sq8 pq "IVF128,PQ96"
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+
+from shared_index import LOSSY_CODES, SharedVectorIndex, default_rerank_factor, resolve_factory
+
+
+def synthetic_corpus(count: int, dimension: int, queries: int, seed: int = 0):
+    """Unit vectors around topic centres, like chunks of a few documents, plus perturbed copies as queries"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(max(1, count // 200), dimension)).astype(np.float32)
+    vectors = centres[rng.integers(len(centres), size=count)] + rng.normal(scale=0.6, size=(count, dimension))
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    picked = vectors[rng.integers(count, size=queries)] + rng.normal(scale=0.02, size=(queries, dimension))
+    picked = (picked / np.linalg.norm(picked, axis=1, keepdims=True)).astype(np.float32)
+    return vectors, picked
+
+
+def exact_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    # Unit vectors: the nearest by L2 are the most similar by inner product
+    scores = queries @ vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def run(factory: str, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int, rerank_factor: int):
+    directory = tempfile.mkdtemp(prefix="vector-bench-")
+    try:
+        # Train right away and always take the filtered ANN path rather than the small-conversation exact scan
+        index = SharedVectorIndex(directory, factory=factory, train_size=0, exact_search_max=0,
+                                  rerank_factor=rerank_factor)
+        texts = [f"chunk {i}" for i in range(len(vectors))]
+        ids = []
+        for start in range(0, len(vectors), 1000):
+            ids.extend(index.add(texts[start:start + 1000], vectors[start:start + 1000]))
+        position = {chunk_id: i for i, chunk_id in enumerate(ids)}
+
+        recalls, latencies = [], []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            hits = index.search(query, k, ids)
+            latencies.append(time.perf_counter() - start)
+            found = {position[chunk_id] for chunk_id, _ in hits}
+            recalls.append(len(found & set(expected.tolist())) / k)
+
+        index_bytes = faiss.serialize_index(index.index).nbytes
+        return {
+            "recall": float(np.mean(recalls)),
+            "bytes_per_vector": index_bytes / len(vectors),
+            "index_mb": index_bytes / 1024 ** 2,
+            "p50_ms": float(np.median(latencies)) * 1000
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=20000, help="corpus size")
+    parser.add_argument("--dimension", type=int, default=1536, help="embedding size (text-embedding-ada-002 is 1536)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5, help="results per search, as in Document Search")
+    parser.add_argument("--types", nargs="+", default=["flat", "fp16", "sq8", "pq"],
+                        help="index presets or faiss.index_factory strings")
+    parser.add_argument("--rerank-factor", type=int, default=None,
+                        help="candidates fetched per result before re-ranking; defaults to the index type's")
+    args = parser.parse_args()
+
+    vectors, queries = synthetic_corpus(args.vectors, args.dimension, args.queries)
+    truth = exact_neighbours(vectors, queries, args.k)
+
+    print(f"{args.vectors} vectors x {args.dimension} dims, {args.queries} queries, recall@{args.k}")
+    print(f"{'index':<16}{'re-rank':>9}{'recall':>9}{'bytes/vec':>11}{'index MB':>10}{'p50 ms':>9}")
+    for factory in args.types:
+        label = resolve_factory(factory, args.dimension)
+        lossy = any(code in label for code in LOSSY_CODES)
+        for rerank_factor in sorted({1, args.rerank_factor or default_rerank_factor(factory)}) if lossy else [1]:
+            result = run(factory, vectors, queries, truth, args.k, rerank_factor)
+            rerank = "off" if rerank_factor == 1 else f"{rerank_factor}x"
+            print(f"{label:<16}{rerank:>9}{result['recall']:>9.3f}{result['bytes_per_vector']:>11.0f}"
+                  f"{result['index_mb']:>10.1f}{result['p50_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+
+class SessionCache:
+    """
+    Dict-like store for per-conversation state that is bounded by entry count,
+    estimated bytes and idle time. The least recently used entries are evicted
+    first; on_evict is called for each evicted entry so related state can be
+    dropped too. Anything evicted must be reloadable from storage.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 ttl_seconds: Optional[float] = None, size_of: Optional[Callable[[Any], int]] = None,
+                 on_evict: Optional[Callable[[str, Any], None]] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.size_of = size_of or (lambda value: 0)
+        self.on_evict = on_evict
+        self.evicted = 0
+        self.expired = 0
+        self.total_bytes = 0
+        # key -> (value, size, last_access), least recently used first
+        self._entries: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __contains__(self, key: str) -> bool:
+        self.evict_expired()
+        with self._lock:
+            return key in self._entries
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        size = self.size_of(value)
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size, time.monotonic())
+            self.total_bytes += size
+        self._evict_over_capacity(keep=key)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._entries))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the value and mark it as recently used"""
+        self.evict_expired()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._entries[key] = (entry[0], entry[1], time.monotonic())
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def touch(self, key: str):
+        """Mark an entry as recently used without reading it"""
+        self.get(key)
+
+    def values(self):
+        with self._lock:
+            return [entry[0] for entry in self._entries.values()]
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        """Remove an entry without counting it as an eviction"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self.total_bytes -= entry[1]
+            return entry[0]
+
+    def evict_expired(self):
+        """Drop entries that have been idle for longer than ttl_seconds"""
+        if self.ttl_seconds is None:
+            return
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = []
+        with self._lock:
+            for key, (value, size, last_access) in self._entries.items():
+                if last_access >= cutoff:
+                    break
+                expired.append(key)
+        for key in expired:
+            if self._evict(key):
+                self.expired += 1
+
+    def _evict_over_capacity(self, keep: str):
+        while True:
+            with self._lock:
+                over_entries = self.max_entries is not None and len(self._entries) > self.max_entries
+                over_bytes = self.max_bytes is not None and self.total_bytes > self.max_bytes
+                if not (over_entries or over_bytes):
+                    return
+                # Never evict the entry that was just inserted, even if it alone exceeds max_bytes
+                victim = next((key for key in self._entries if key != keep), None)
+            if victim is None:
+                return
+            self._evict(victim)
+
+    def _evict(self, key: str) -> bool:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False
+            self.total_bytes -= entry[1]
+            self.evicted += 1
+        if self.on_evict is not None:
+            self.on_evict(key, entry[0])
+        return True
+
+    def stats(self) -> Dict:
+        """Resident and evicted counts"""
+        with self._lock:
+            return {
+                "resident": len(self._entries),
+                "resident_bytes": self.total_bytes,
+                "evicted": self.evicted,
+                "expired": self.expired,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds
+            }
@@ -0,0 +1,526 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Shorthands for VECTOR_INDEX_FACTORY; anything else is passed to faiss.index_factory as is
+INDEX_PRESETS = {
+    "flat": "Flat",
+    "fp16": "SQfp16",
+    "sq8": "SQ8",
+    # One 8-bit code per 16 dimensions, i.e. 96 bytes instead of 6 KB for a 1536-d embedding
+    "pq": "PQ{pq_m}",
+}
+# Index types that store approximate vectors, whose candidates are re-ranked with exact distances
+LOSSY_CODES = ("SQ", "PQ", "RQ", "LSH")
+# Candidates fetched per result for re-ranking unless rerank_factor is given. PQ codes are too coarse
+# to rank by: PQ96's recall@5 in scripts/vector_index_benchmark.py (10k vectors) is 0.27 as is,
+# 0.44 re-ranking 4x, 0.97 at 32x and 1.0 at 64x
+DEFAULT_RERANK_FACTOR = 4
+PRESET_RERANK_FACTORS = {"pq": 64}
+# Vectors read from SQLite at a time when rebuilding, so a rebuild never holds the whole corpus in memory
+REBUILD_BATCH_SIZE = 10000
+
+
+def default_rerank_factor(factory: str) -> int:
+    return PRESET_RERANK_FACTORS.get(factory.lower(), DEFAULT_RERANK_FACTOR)
+
+
+def resolve_factory(factory: str, dimension: int) -> str:
+    """Expand an INDEX_PRESETS name into a faiss.index_factory string for this dimension"""
+    preset = INDEX_PRESETS.get(factory.lower())
+    if preset is None:
+        return factory
+    pq_m = max(1, dimension // 16)
+    while dimension % pq_m:
+        pq_m -= 1
+    return preset.format(pq_m=pq_m)
+
+
+class SharedVectorIndex:
+    """
+    One FAISS index holding every conversation's chunks. Each distinct chunk text
+    is stored once and reference-counted by the files that contain it, and a
+    search only considers the chunk IDs it is given. SQLite is the source of
+    truth for chunk text and vectors; the FAISS file is a snapshot that is
+    reconciled with it on startup.
+    """
+
+    def __init__(self, directory: str, factory: str = "Flat", train_size: int = 50000,
+                 nprobe: int = 16, ef_search: int = 128, exact_search_max: int = 4096,
+                 rerank_factor: Optional[int] = None):
+        self.directory = directory
+        # An INDEX_PRESETS name or any faiss.index_factory string, e.g. "HNSW32", "IVF1024,Flat" or "IVF1024,PQ64"
+        self.factory = factory
+        # Index types that need training stay flat until this many chunks are stored
+        self.train_size = train_size
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        # Conversations with at most this many chunks are searched exactly over their own vectors
+        self.exact_search_max = exact_search_max
+        # Lossy indexes fetch k * rerank_factor candidates and re-rank them against the float32 vectors
+        self.rerank_factor = rerank_factor or default_rerank_factor(factory)
+        # An IndexIDMap2 around the index type, or the index itself for IVF types, which hold chunk IDs natively
+        self.index: Optional[faiss.Index] = None
+        self.active_factory: Optional[str] = None
+        self.tombstones = 0
+        self._needs_training: Optional[bool] = None
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._lock = threading.RLock()
+        # Set while a replacement index is built in the background, with the chunk IDs removed meanwhile
+        self._rebuild_thread: Optional[threading.Thread] = None
+        self._pending_removals: Optional[List[int]] = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, "vectors.faiss")
+        self._db_path = os.path.join(directory, "chunks.sqlite")
+        self._conn = sqlite3.connect(self._db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # AUTOINCREMENT so IDs of deleted chunks are never handed out again
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, content_hash TEXT NOT NULL UNIQUE, "
+            "text TEXT NOT NULL, vector BLOB NOT NULL, refs INTEGER NOT NULL)"
+        )
+        # Which owner (a conversation's file) holds each reference, written in the same transaction as refs,
+        # so a conversation can tell after a crash which references it really holds
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_owners ("
+            "owner TEXT NOT NULL, chunk_id INTEGER NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (owner, chunk_id))"
+        )
+        self._conn.commit()
+        self._load()
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def add(self, texts: List[str], vectors: List[List[float]], owner: Optional[str] = None) -> List[int]:
+        """Store chunks, reusing any already stored with the same text, and return their IDs"""
+        ids = []
+        new_ids, new_vectors = [], []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                content_hash = self.content_hash(text)
+                row = self._conn.execute("SELECT id FROM chunks WHERE content_hash = ?", (content_hash,)).fetchone()
+                if row is not None:
+                    self._conn.execute("UPDATE chunks SET refs = refs + 1 WHERE id = ?", (row[0],))
+                    ids.append(row[0])
+                    continue
+                vector = np.asarray(vector, dtype=np.float32)
+                cursor = self._conn.execute(
+                    "INSERT INTO chunks (content_hash, text, vector, refs) VALUES (?, ?, ?, 1)",
+                    (content_hash, text, vector.tobytes())
+                )
+                ids.append(cursor.lastrowid)
+                new_ids.append(cursor.lastrowid)
+                new_vectors.append(vector)
+            if owner is not None:
+                self._own(owner, ids, 1)
+            self._conn.commit()
+
+            if new_ids:
+                self._add_to_index(np.asarray(new_ids, dtype=np.int64), np.stack(new_vectors))
+        return ids
+
+    def release(self, ids: Sequence[int], owner: Optional[str] = None):
+        """Drop one reference to each chunk, deleting chunks nobody refers to any more"""
+        if not ids:
+            return
+        with self._lock:
+            if owner is not None:
+                self._own(owner, ids, -1)
+            self._conn.executemany(
+                "UPDATE chunks SET refs = refs - ? WHERE id = ?",
+                [(count, chunk_id) for chunk_id, count in Counter(ids).items()]
+            )
+            unused = [row[0] for row in self._conn.execute("SELECT id FROM chunks WHERE refs <= 0")]
+            self._conn.execute("DELETE FROM chunks WHERE refs <= 0")
+            self._conn.commit()
+            if self._pending_removals is not None:
+                self._pending_removals.extend(unused)
+            if unused and self.index is not None:
+                self._remove_from_index(np.asarray(unused, dtype=np.int64))
+
+    def owned(self, prefix: str) -> Dict[str, List[int]]:
+        """Chunk IDs, one per reference, held by each owner whose name starts with prefix"""
+        owners: Dict[str, List[int]] = {}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT owner, chunk_id, count FROM chunk_owners WHERE substr(owner, 1, ?) = ?", (len(prefix), prefix)
+            ).fetchall()
+        for owner, chunk_id, count in rows:
+            owners.setdefault(owner, []).extend([chunk_id] * count)
+        return owners
+
+    def adopt(self, owner: str, ids: Sequence[int]):
+        """Record references taken before owners were tracked, without counting them again"""
+        with self._lock:
+            self._own(owner, ids, 1)
+            self._conn.commit()
+
+    def _own(self, owner: str, ids: Sequence[int], sign: int):
+        # Part of the caller's transaction
+        self._conn.executemany(
+            "INSERT INTO chunk_owners (owner, chunk_id, count) VALUES (?, ?, ?) "
+            "ON CONFLICT(owner, chunk_id) DO UPDATE SET count = count + excluded.count",
+            [(owner, chunk_id, sign * count) for chunk_id, count in Counter(ids).items()]
+        )
+        self._conn.execute("DELETE FROM chunk_owners WHERE owner = ? AND count <= 0", (owner,))
+
+    def search(self, vector: List[float], k: int, ids: Sequence[int]) -> List[Tuple[int, float]]:
+        """Return up to k (chunk ID, L2 distance) pairs among `ids`, nearest first"""
+        query = np.asarray([vector], dtype=np.float32)
+        candidates = np.unique(np.asarray(ids, dtype=np.int64))
+        with self._lock:
+            if self.index is None or not len(candidates):
+                return []
+            lossy = any(code in self.active_factory for code in LOSSY_CODES)
+            fetch_k = k * self.rerank_factor if lossy else k
+            hits = self._candidates(query, fetch_k, candidates)
+            if lossy and hits:
+                hits = self._rerank(query, [chunk_id for chunk_id, _ in hits], k)
+        return hits[:k]
+
+    def _candidates(self, query: np.ndarray, k: int, candidates: np.ndarray) -> List[Tuple[int, float]]:
+        if len(candidates) <= self.exact_search_max:
+            # Cost depends only on the conversation's size, not on the whole corpus
+            hits = self._scan(query, k, candidates)
+            if hits is not None:
+                return hits
+
+        selector = faiss.IDSelectorBatch(candidates)
+        try:
+            distances, found = self.index.search(query, k, params=self._search_params(selector))
+        except RuntimeError:
+            # Some index types, e.g. a plain PQ index, don't accept an ID filter; scan the decoded codes instead
+            return self._scan(query, k, candidates, batch_size=self.exact_search_max or 4096) or []
+        return [(int(chunk_id), float(distance)) for chunk_id, distance in zip(found[0], distances[0]) if chunk_id != -1]
+
+    def _scan(self, query: np.ndarray, k: int, candidates: np.ndarray,
+              batch_size: Optional[int] = None) -> Optional[List[Tuple[int, float]]]:
+        """
+        Exact distances to the candidates' stored (possibly decoded) vectors.
+        Candidates the index doesn't hold are skipped; returns None if none of
+        them can be reconstructed, e.g. because the index type doesn't support it.
+        """
+        batch_size = batch_size or len(candidates)
+        kept, distances = [], []
+        for start in range(0, len(candidates), batch_size):
+            batch = candidates[start:start + batch_size]
+            try:
+                stored = self.index.reconstruct_batch(batch)
+            except RuntimeError:
+                # One ID missing from the index fails the whole batch, so reconstruct it one ID at a time
+                batch, stored = self._reconstruct_each(batch)
+                if not len(batch):
+                    continue
+            kept.append(batch)
+            distances.append(((stored - query) ** 2).sum(axis=1))
+        if not kept:
+            return None
+        kept, distances = np.concatenate(kept), np.concatenate(distances)
+        if len(kept) < len(candidates):
+            logger.warning("Skipped %d chunk IDs missing from the vector index", len(candidates) - len(kept))
+        order = np.argsort(distances)[:k]
+        return [(int(kept[i]), float(distances[i])) for i in order]
+
+    def _reconstruct_each(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        kept, stored = [], []
+        for chunk_id in ids.tolist():
+            try:
+                stored.append(self.index.reconstruct(chunk_id))
+            except RuntimeError:
+                continue
+            kept.append(chunk_id)
+        if not kept:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.index.d), dtype=np.float32)
+        return np.asarray(kept, dtype=np.int64), np.stack(stored)
+
+    def _rerank(self, query: np.ndarray, chunk_ids: List[int], k: int) -> List[Tuple[int, float]]:
+        """Exact distances from the float32 vectors kept in SQLite, which never have to be in memory"""
+        placeholders = ",".join("?" * len(chunk_ids))
+        rows = self._conn.execute(
+            f"SELECT id, vector FROM chunks WHERE id IN ({placeholders})", chunk_ids
+        ).fetchall()
+        if not rows:
+            return []
+        vectors = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        distances = ((vectors - query) ** 2).sum(axis=1)
+        order = np.argsort(distances)[:k]
+        return [(rows[i][0], float(distances[i])) for i in order]
+
+    def get_texts(self, ids: Sequence[int]) -> Dict[int, str]:
+        texts = {}
+        unique_ids = list(dict.fromkeys(ids))
+        with self._lock:
+            for start in range(0, len(unique_ids), 500):
+                batch = unique_ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                texts.update(self._conn.execute(
+                    f"SELECT id, text FROM chunks WHERE id IN ({placeholders})", batch
+                ).fetchall())
+        return texts
+
+    def save(self, min_interval: float = 0.0):
+        """Snapshot the FAISS index if it changed and the last snapshot is older than min_interval seconds"""
+        with self._lock:
+            if not self._dirty or time.monotonic() - self._saved_at < min_interval:
+                return
+            temp_file = self.index_path + ".tmp"
+            faiss.write_index(self.index, temp_file)
+            os.replace(temp_file, self.index_path)
+            with open(os.path.join(self.directory, "vectors.json"), "w") as f:
+                json.dump({"factory": self.active_factory}, f)
+            self._dirty = False
+            self._saved_at = time.monotonic()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            chunks, references = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(refs), 0) FROM chunks").fetchone()
+            return {
+                "factory": self.factory,
+                "active_factory": self.active_factory,
+                "vectors": self.index.ntotal if self.index is not None else 0,
+                "chunks": chunks,
+                "references": references,
+                "dedup_ratio": references / chunks if chunks else 0.0,
+                "bytes_per_vector": self._bytes_per_vector(),
+                "rerank_factor": self.rerank_factor,
+                "tombstones": self.tombstones
+            }
+
+    def _bytes_per_vector(self) -> Optional[int]:
+        """In-memory code size per vector, excluding graph links and list overhead"""
+        if self.index is None:
+            return None
+        base = self._base_index()
+        if isinstance(base, faiss.IndexHNSW):
+            base = faiss.downcast_index(base.storage)
+        try:
+            return base.sa_code_size()
+        except RuntimeError:
+            return None
+
+    def _base_index(self) -> faiss.Index:
+        """The index type itself, without the ID map around it"""
+        if isinstance(self.index, faiss.IndexIDMap2):
+            return faiss.downcast_index(self.index.index)
+        return self.index
+
+    def _target_factory(self, count: int, dimension: int) -> str:
+        """The configured index type, or Flat while there aren't enough vectors to train it"""
+        factory = resolve_factory(self.factory, dimension)
+        if self._needs_training is None:
+            self._needs_training = not faiss.index_factory(dimension, factory).is_trained
+        if self._needs_training and count < self.train_size:
+            return "Flat"
+        return factory
+
+    @staticmethod
+    def _stored_vectors(conn: sqlite3.Connection, after_id: int = 0,
+                        max_id: Optional[int] = None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Stored chunk IDs and vectors in ID order, REBUILD_BATCH_SIZE at a time"""
+        while True:
+            query, params = "SELECT id, vector FROM chunks WHERE id > ?", (after_id,)
+            if max_id is not None:
+                query, params = query + " AND id <= ?", params + (max_id,)
+            rows = conn.execute(query + " ORDER BY id LIMIT ?", params + (REBUILD_BATCH_SIZE,)).fetchall()
+            if not rows:
+                return
+            after_id = rows[-1][0]
+            yield (np.asarray([row[0] for row in rows], dtype=np.int64),
+                   np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows]))
+
+    @staticmethod
+    def _stored_shape(conn: sqlite3.Connection, max_id: int) -> Tuple[int, Optional[int]]:
+        """Number of stored chunks up to max_id and their vectors' dimension, None if there are none"""
+        count = conn.execute("SELECT COUNT(*) FROM chunks WHERE id <= ?", (max_id,)).fetchone()[0]
+        row = conn.execute("SELECT vector FROM chunks WHERE id <= ? LIMIT 1", (max_id,)).fetchone()
+        return count, len(row[0]) // 4 if row else None
+
+    def _training_sample(self, conn: sqlite3.Connection, max_id: int) -> np.ndarray:
+        """Up to train_size stored vectors picked at random"""
+        ids = np.fromiter((row[0] for row in conn.execute("SELECT id FROM chunks WHERE id <= ?", (max_id,))),
+                          dtype=np.int64)
+        if len(ids) > self.train_size:
+            ids = np.sort(np.random.default_rng().choice(ids, self.train_size, replace=False))
+        vectors = []
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500].tolist()
+            placeholders = ",".join("?" * len(batch))
+            vectors.extend(
+                np.frombuffer(row[0], dtype=np.float32)
+                for row in conn.execute(f"SELECT vector FROM chunks WHERE id IN ({placeholders})", batch)
+            )
+        return np.stack(vectors)
+
+    def _new_index(self, factory: str, dimension: int) -> faiss.Index:
+        base = faiss.index_factory(dimension, factory)
+        ivf = self._ivf(base)
+        if ivf is None:
+            return faiss.IndexIDMap2(base)
+        # IVF indexes take chunk IDs themselves. A hashtable direct map lets them reconstruct
+        # and remove chunks by ID, which fails on IDs translated by an IndexIDMap2 around them
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return base
+
+    def _build(self, conn: sqlite3.Connection, max_id: int) -> Tuple[Optional[faiss.Index], Optional[str]]:
+        """
+        A new index holding the chunks stored up to max_id, trained on a sample of them and filled
+        batch by batch; touches no state, so it can run outside the lock
+        """
+        count, dimension = self._stored_shape(conn, max_id)
+        if dimension is None:
+            return None, None
+        factory = self._target_factory(count, dimension)
+        index = self._new_index(factory, dimension)
+        if not index.is_trained:
+            index.train(self._training_sample(conn, max_id))
+        for ids, vectors in self._stored_vectors(conn, max_id=max_id):
+            index.add_with_ids(vectors, ids)
+        return index, factory
+
+    def _install(self, index: Optional[faiss.Index], factory: Optional[str]):
+        self.index = index
+        self.active_factory = factory
+        self.tombstones = 0
+        self._dirty = index is not None
+
+    def _rebuild(self):
+        """Rebuild in the calling thread, for startup and for an index small enough to build right away"""
+        max_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM chunks").fetchone()[0]
+        self._install(*self._build(self._conn, max_id))
+
+    def _schedule_rebuild(self):
+        """Rebuild on a background thread; until it is swapped in, searches and changes use the current index"""
+        if self._rebuild_thread is not None:
+            return
+        self._rebuild_thread = threading.Thread(target=self._rebuild_in_background, name="vector-index-rebuild",
+                                                daemon=True)
+        self._rebuild_thread.start()
+
+    def _rebuild_in_background(self):
+        conn = sqlite3.connect(self._db_path)
+        try:
+            with self._lock:
+                # Pin a read snapshot; chunks removed from here on are replayed onto the new index
+                conn.execute("BEGIN")
+                max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM chunks").fetchone()[0]
+                self._pending_removals = []
+            index, factory = self._build(conn, max_id)
+            conn.rollback()
+
+            with self._lock:
+                self._rebuild_thread = None
+                removed, self._pending_removals = self._pending_removals, None
+                if index is None:
+                    # Nothing was stored when the rebuild started, so whatever is there now is small
+                    self._rebuild()
+                    return
+                # Chunks added while it was being built have higher IDs (AUTOINCREMENT never reuses them)
+                for ids, vectors in self._stored_vectors(self._conn, after_id=max_id):
+                    index.add_with_ids(vectors, ids)
+                self._install(index, factory)
+                if removed:
+                    self._remove_from_index(np.asarray(removed, dtype=np.int64))
+        except Exception:
+            logger.exception("Rebuilding the vector index failed; keeping the current one")
+            with self._lock:
+                self._pending_removals = None
+                self._rebuild_thread = None
+        finally:
+            conn.close()
+
+    def _add_to_index(self, ids: np.ndarray, vectors: np.ndarray):
+        if self.index is None:
+            factory = self._target_factory(len(ids), vectors.shape[1])
+            index = self._new_index(factory, vectors.shape[1])
+            if not index.is_trained:
+                index.train(vectors)
+            index.add_with_ids(vectors, ids)
+            self._install(index, factory)
+            return
+        self.index.add_with_ids(vectors, ids)
+        self._dirty = True
+        if self.active_factory != self._target_factory(self.index.ntotal - self.tombstones, self.index.d):
+            # Enough vectors have accumulated to train the configured index type
+            self._schedule_rebuild()
+
+    def _remove_from_index(self, ids: np.ndarray):
+        try:
+            self.index.remove_ids(faiss.IDSelectorArray(ids))
+        except RuntimeError:
+            # HNSW can't delete; unused vectors are never selected, so just rebuild once they pile up
+            self.tombstones += len(ids)
+            if self.tombstones > 0.2 * self.index.ntotal:
+                self._schedule_rebuild()
+        self._dirty = True
+
+    def _indexed_ids(self) -> np.ndarray:
+        if isinstance(self.index, faiss.IndexIDMap2):
+            return faiss.vector_to_array(self.index.id_map)
+        invlists = self._ivf(self.index).invlists
+        ids = [np.empty(0, dtype=np.int64)]
+        for list_no in range(invlists.nlist):
+            size = invlists.list_size(list_no)
+            if size:
+                ids.append(faiss.rev_swig_ptr(invlists.get_ids(list_no), size).copy())
+        return np.concatenate(ids)
+
+    def _load(self):
+        config_file = os.path.join(self.directory, "vectors.json")
+        if os.path.exists(self.index_path) and os.path.exists(config_file):
+            with open(config_file, "r") as f:
+                self.active_factory = json.load(f)["factory"]
+            self.index = faiss.read_index(self.index_path)
+
+        stored_ids = {row[0] for row in self._conn.execute("SELECT id FROM chunks")}
+        if self.index is None or self.active_factory != self._target_factory(len(stored_ids), self.index.d) or \
+                (isinstance(self.index, faiss.IndexIDMap2) and self._ivf(self._base_index()) is not None):
+            # Snapshots from before IVF indexes held their own IDs can't delete, so they are rebuilt too
+            self._rebuild()
+            return
+
+        # Reconcile a snapshot taken before the last changes were made
+        indexed_ids = set(self._indexed_ids().tolist())
+        missing = sorted(stored_ids - indexed_ids)
+        extra = sorted(indexed_ids - stored_ids)
+        if extra:
+            self._remove_from_index(np.asarray(extra, dtype=np.int64))
+        if missing:
+            placeholders = ",".join("?" * len(missing))
+            rows = self._conn.execute(
+                f"SELECT id, vector FROM chunks WHERE id IN ({placeholders})", missing
+            ).fetchall()
+            self.index.add_with_ids(
+                np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows]),
+                np.asarray([row[0] for row in rows], dtype=np.int64)
+            )
+            self._dirty = True
+
+    @staticmethod
+    def _ivf(index: faiss.Index):
+        try:
+            return faiss.extract_index_ivf(index)
+        except RuntimeError:
+            return None
+
+    def _search_params(self, selector: faiss.IDSelector) -> faiss.SearchParameters:
+        base = self._base_index()
+        if self._ivf(base) is not None:
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        if isinstance(base, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search)
+        return faiss.SearchParameters(sel=selector)
@@ -0,0 +1,79 @@
+import json
+import re
+from typing import Dict
+
+JSON_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+def sse_event(event: str, data: Dict) -> str:
+    """Format a Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class FinalAnswerStreamer:
+    """
+    Incrementally extracts the answer text from the JSON blob a conversational
+    ReAct agent streams back, e.g. {"action": "Final Answer", "action_input": "..."},
+    so answer tokens can be forwarded before the LLM call finishes.
+    """
+
+    _ANSWER_START = re.compile(r'"action"\s*:\s*"Final Answer"\s*,\s*"action_input"\s*:\s*"')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Start parsing a new LLM response"""
+        self.buffer = ""
+        self.position = None
+        self.done = False
+
+    def feed(self, text: str) -> str:
+        """Add streamed LLM output and return any newly decoded answer text"""
+        self.buffer += text
+        if self.done:
+            return ""
+        if self.position is None:
+            match = self._ANSWER_START.search(self.buffer)
+            if not match:
+                return ""
+            self.position = match.end()
+
+        decoded = []
+        buffer = self.buffer
+        i = self.position
+        while i < len(buffer):
+            char = buffer[i]
+            if char == '"':
+                self.done = True
+                i += 1
+                break
+            if char != "\\":
+                decoded.append(char)
+                i += 1
+                continue
+
+            # Escape sequences may be split across chunks; wait until they are complete
+            if i + 1 >= len(buffer):
+                break
+            if buffer[i + 1] != "u":
+                decoded.append(JSON_ESCAPES.get(buffer[i + 1], buffer[i + 1]))
+                i += 2
+                continue
+            if i + 6 > len(buffer):
+                break
+            code = int(buffer[i + 2:i + 6], 16)
+            if 0xD800 <= code < 0xDC00:
+                # High surrogate: combine with the following low surrogate escape
+                if i + 12 > len(buffer):
+                    break
+                if buffer[i + 6:i + 8] == "\\u":
+                    low = int(buffer[i + 8:i + 12], 16)
+                    decoded.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                    i += 12
+                    continue
+            decoded.append(chr(code))
+            i += 6
+
+        self.position = i
+        return "".join(decoded)
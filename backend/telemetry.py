@@ -0,0 +1,312 @@
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _label_text(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _le(bound: Any) -> str:
+    return 'le="%s"' % bound
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """Monotonic count per label set, in Prometheus text format"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(_escape(labels.get(name, "")) for name in self.labels)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            return [f"{self.name}{_label_text(self.labels, key)} {value}" for key, value in self.values.items()]
+
+
+class Histogram(Counter):
+    """Cumulative bucket counts, sum and count per label set, in Prometheus text format"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+        # label set -> (per-bucket counts, sum, count)
+        self.series: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total, count = self.series.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.series[key] = (counts, total + value, count + 1)
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self.lock:
+            for key, (counts, total, count) in self.series.items():
+                labels = _label_text(self.labels, key)
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_label_text(self.labels, key, _le(bound))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, key, _le('+Inf'))} {count}")
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Metrics:
+    """Process-wide metrics, rendered in the Prometheus text exposition format for GET /metrics"""
+
+    def __init__(self):
+        self.metrics: List[Counter] = []
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, description, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, description: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, description, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+SPAN_SECONDS = metrics.histogram(
+    "rag_span_seconds", "Duration of instrumented steps: parsing, splitting, embedding, indexing, retrieval, agent iterations",
+    ("span",)
+)
+REQUEST_SECONDS = metrics.histogram(
+    "rag_request_seconds",
+    "End-to-end request duration; outcome is the chat mode used, cache, no_documents, cancelled, error or job status",
+    ("endpoint", "outcome")
+)
+LLM_CALL_SECONDS = metrics.histogram("rag_llm_call_seconds", "Duration of each chat model call", ("model",))
+LLM_TOKENS = metrics.counter(
+    "rag_llm_tokens_total", "Chat model tokens by kind: input, output, and cached input", ("model", "kind")
+)
+
+
+class RequestTimings:
+    """Spans and LLM usage recorded while serving one request or ingestion job"""
+
+    def __init__(self, sampled: bool = False):
+        self.started_at = time.perf_counter()
+        self.finished_at: Optional[float] = None
+        # Whether this request's steps are written to the structured log
+        self.sampled = sampled
+        self.spans: Dict[str, List[float]] = {}
+        self.llm = {"calls": 0, "seconds": 0.0, "input_tokens": 0, "output_tokens": 0, "cached_tokens": 0}
+
+    def add(self, name: str, seconds: float):
+        span = self.spans.setdefault(name, [0, 0.0])
+        span[0] += 1
+        span[1] += seconds
+
+    def add_llm_call(self, seconds: float, input_tokens: int, output_tokens: int, cached_tokens: int):
+        self.llm["calls"] += 1
+        self.llm["seconds"] += seconds
+        self.llm["input_tokens"] += input_tokens
+        self.llm["output_tokens"] += output_tokens
+        self.llm["cached_tokens"] += cached_tokens
+
+    def finish(self) -> float:
+        self.finished_at = time.perf_counter()
+        return self.finished_at - self.started_at
+
+    def to_dict(self) -> Dict:
+        """Seconds per span; spans that overlap (parse-ahead, parallel files) can add up to more than the total"""
+        total = (self.finished_at or time.perf_counter()) - self.started_at
+        return {
+            "total_seconds": round(total, 4),
+            "spans": {
+                name: {"count": count, "seconds": round(seconds, 4)}
+                for name, (count, seconds) in self.spans.items()
+            },
+            "llm": {**self.llm, "seconds": round(self.llm["seconds"], 4)}
+        }
+
+
+# Timings of the request being served; unset outside requests and ingestion jobs
+request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def start_timings(sample_rate: float) -> RequestTimings:
+    """Begin recording the current request, sampled for the structured log with probability sample_rate"""
+    timings = RequestTimings(sampled=random.random() < sample_rate)
+    request_timings.set(timings)
+    return timings
+
+
+def record_span(name: str, seconds: float):
+    SPAN_SECONDS.observe(seconds, span=name)
+    timings = request_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the enclosed step into rag_span_seconds and the current request's timings"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started)
+
+
+def log_event(event: str, **fields):
+    """Write one JSON log line, but only for requests picked by sampling"""
+    timings = request_timings.get()
+    if timings is not None and timings.sampled:
+        logger.info(json.dumps({"event": event, **fields}, default=str))
+
+
+class LLMCallTelemetry(BaseCallbackHandler):
+    """Times every chat model call and counts its tokens, including prompt tokens served from the provider's cache"""
+
+    # Called directly on the event loop, so the current request's timings are visible
+    run_inline = True
+
+    def __init__(self):
+        self.started: Dict[UUID, Tuple[float, str]] = {}
+        # Process-wide totals for /llm/stats
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *,
+                            run_id: UUID, **kwargs: Any) -> None:
+        params = kwargs.get("invocation_params") or {}
+        self.started[run_id] = (time.perf_counter(), params.get("model_name") or params.get("model") or "unknown")
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        started, model = self.started.pop(run_id, (None, "unknown"))
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        input_tokens = output_tokens = cached_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+                cached_tokens += (usage.get("input_token_details") or {}).get("cache_read", 0)
+
+        with self.lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+            self.cached_tokens += cached_tokens
+        LLM_CALL_SECONDS.observe(seconds, model=model)
+        LLM_TOKENS.inc(input_tokens, model=model, kind="input")
+        LLM_TOKENS.inc(output_tokens, model=model, kind="output")
+        LLM_TOKENS.inc(cached_tokens, model=model, kind="cached")
+        timings = request_timings.get()
+        if timings is not None:
+            timings.add_llm_call(seconds, input_tokens, output_tokens, cached_tokens)
+        log_event("llm_call", model=model, seconds=round(seconds, 4), input_tokens=input_tokens,
+                  output_tokens=output_tokens, cached_tokens=cached_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.started.pop(run_id, None)
+
+    def prompt_cache_stats(self) -> Dict:
+        """How many of the prompt tokens sent so far the provider served from its prompt cache"""
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "input_tokens": self.input_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cached_share": self.cached_tokens / self.input_tokens if self.input_tokens else 0.0
+            }
+
+
+class AgentTelemetry(BaseCallbackHandler):
+    """
+    Times agent iterations, each running from one decision of the agent to the
+    next (the tool call it chose plus the LLM call that decides what's next),
+    and logs the decisions of sampled requests. Attached to the AgentExecutor,
+    which reports chain start/end and each action and finish.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self.marks: Dict[UUID, float] = {}
+
+    def _iteration(self, run_id: UUID) -> Optional[float]:
+        started = self.marks.get(run_id)
+        if started is None:
+            return None
+        now = time.perf_counter()
+        self.marks[run_id] = now
+        record_span("agent_iteration", now - started)
+        return now - started
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Dict[str, Any], *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        if parent_run_id is None:
+            self.marks[run_id] = time.perf_counter()
+
+    def on_agent_action(self, action: AgentAction, *, run_id: UUID, **kwargs: Any) -> None:
+        seconds = self._iteration(run_id)
+        log_event("agent_action", tool=action.tool, input=action.tool_input,
+                  seconds=round(seconds, 4) if seconds is not None else None)
+
+    def on_agent_finish(self, finish: AgentFinish, *, run_id: UUID, **kwargs: Any) -> None:
+        seconds = self._iteration(run_id)
+        log_event("agent_finish", seconds=round(seconds, 4) if seconds is not None else None)
+
+    def on_chain_end(self, outputs: Dict[str, Any], *, run_id: UUID, **kwargs: Any) -> None:
+        self.marks.pop(run_id, None)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.marks.pop(run_id, None)
@@ -0,0 +1,116 @@
+import asyncio
+import functools
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import tiktoken
+from langchain.memory import ConversationSummaryBufferMemory
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.schema import BaseMessage, SystemMessage, get_buffer_string
+from langchain_core.caches import BaseCache
+from langchain_core.callbacks import Callbacks
+from pydantic import PrivateAttr
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model_name: str) -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_message_tokens(message: BaseMessage, model_name: str) -> int:
+    """Tokens a chat message takes up in a prompt, including the per-message framing overhead"""
+    return len(_encoding(model_name).encode(str(message.content))) + 4
+
+
+class TokenBudgetMemory(ConversationSummaryBufferMemory):
+    """
+    Keeps the most recent turns verbatim within max_token_limit tokens and folds
+    older turns into a rolling summary, so the prompt stops growing with the
+    conversation. Pruning happens when the memory is read, right before a
+    prompt is built, one read at a time. System messages are never folded.
+    """
+
+    token_model: str = "gpt-4o"
+    # Number of stored interactions already folded into moving_summary_buffer
+    summarized_turns: int = 0
+    # Called with (summary, summarized_turns) whenever the summary changes
+    on_summarize: Optional[Callable[[str, int], None]] = None
+    # Concurrent reads of one conversation (a double submit, a retried stream)
+    # would otherwise both summarize and count the same oldest turns
+    _prune_lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+    _aprune_lock: asyncio.Lock = PrivateAttr(default_factory=asyncio.Lock)
+
+    def _split(self) -> Tuple[List[BaseMessage], List[BaseMessage], List[BaseMessage]]:
+        """Return (pinned system messages, turns to fold, turns to keep)"""
+        messages = self.chat_memory.messages
+        pinned = [message for message in messages if isinstance(message, SystemMessage)]
+        turns = [message for message in messages if not isinstance(message, SystemMessage)]
+        counts = [count_message_tokens(message, self.token_model) for message in turns]
+
+        total = sum(counts)
+        cut = 0
+        while total > self.max_token_limit and cut < len(turns):
+            # Fold a question together with its answer
+            step = min(2, len(turns) - cut)
+            total -= sum(counts[cut:cut + step])
+            cut += step
+        return pinned, turns[:cut], turns[cut:]
+
+    def _fold(self, folded: List[BaseMessage], summary: str):
+        with self._prune_lock:
+            turns = [message for message in self.chat_memory.messages if not isinstance(message, SystemMessage)]
+            # Only fold turns that are still the oldest ones; if they are gone, another prune already counted them
+            if len(turns) < len(folded) or any(turn is not message for turn, message in zip(turns, folded)):
+                return
+            folded_ids = {id(message) for message in folded}
+            # Rebuild from the live list: another request may have appended while the summary was written
+            self.chat_memory.messages = [
+                message for message in self.chat_memory.messages if id(message) not in folded_ids
+            ]
+            self.moving_summary_buffer = summary
+            self.summarized_turns += (len(folded) + 1) // 2
+            if self.on_summarize is not None:
+                self.on_summarize(self.moving_summary_buffer, self.summarized_turns)
+
+    def prune(self) -> None:
+        with self._prune_lock:
+            _, folded, _ = self._split()
+            if folded:
+                self._fold(folded, self.predict_new_summary(folded, self.moving_summary_buffer))
+
+    async def aprune(self) -> None:
+        async with self._aprune_lock:
+            _, folded, _ = self._split()
+            if folded:
+                self._fold(folded, await self.apredict_new_summary(folded, self.moving_summary_buffer))
+
+    def _buffer(self) -> Dict[str, Any]:
+        pinned, _, turns = self._split()
+        summary = [self.summary_message_cls(content=self.moving_summary_buffer)] if self.moving_summary_buffer else []
+        # The summary goes after the system prompt and before the verbatim turns
+        buffer = pinned + summary + turns
+        if not self.return_messages:
+            buffer = get_buffer_string(buffer, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
+        return {self.memory_key: buffer}
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        self.prune()
+        return self._buffer()
+
+    async def aload_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        await self.aprune()
+        return self._buffer()
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        # Pruning is deferred to the next read, so saving never waits on the summarizer
+        BaseChatMemory.save_context(self, inputs, outputs)
+
+    async def asave_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        await BaseChatMemory.asave_context(self, inputs, outputs)
+
+
+# The inherited LLM fields refer to these by name
+TokenBudgetMemory.model_rebuild(_types_namespace={"BaseCache": BaseCache, "Callbacks": Callbacks})
@@ -1,3 +1,6 @@
+import json
+import time
+
 import streamlit as st
 import requests
 from dotenv import load_dotenv
@@ -8,6 +11,12 @@ load_dotenv()
 # API endpoint
 API_URL = "http://backend:8000"
 
+# Interactions fetched per page of conversation history
+HISTORY_PAGE_SIZE = 25
+
+# Conversations shown in the sidebar before "Show more"
+CONVERSATIONS_PAGE_SIZE = 50
+
 # Initialize session state
 if 'current_conversation_id' not in st.session_state:
     st.session_state.current_conversation_id = None
@@ -23,6 +32,12 @@ if 'conversations_list' not in st.session_state:
     st.session_state.conversations_list = []
 if 'conversation_files' not in st.session_state:
     st.session_state.conversation_files = []
+if 'history_before' not in st.session_state:
+    st.session_state.history_before = None
+if 'conversations_limit' not in st.session_state:
+    st.session_state.conversations_limit = CONVERSATIONS_PAGE_SIZE
+if 'has_more_conversations' not in st.session_state:
+    st.session_state.has_more_conversations = False
 
 # Page config
 st.set_page_config(
@@ -349,27 +364,40 @@ def create_new_conversation():
             data = response.json()
             st.session_state.current_conversation_id = data["conversation_id"]
             st.session_state.conversation_history = []
+            st.session_state.history_before = None
             return True
     except Exception as e:
         st.error(f"Failed to create new conversation: {str(e)}")
         return False
 
 def load_conversations():
-    """Load all conversations from the backend"""
+    """Load the most recently updated conversations from the backend"""
     try:
-        response = requests.get(f"{API_URL}/conversations")
+        response = requests.get(
+            f"{API_URL}/conversations",
+            params={"limit": st.session_state.conversations_limit, "sort": "last_updated"}
+        )
         if response.status_code == 200:
-            st.session_state.conversations_list = response.json()
+            data = response.json()
+            st.session_state.conversations_list = data["conversations"]
+            st.session_state.has_more_conversations = data["next_cursor"] is not None
     except Exception as e:
         st.error(f"Failed to load conversations: {str(e)}")
 
-def load_conversation_history(conversation_id: str):
-    """Load conversation history from the backend"""
+def load_conversation_history(conversation_id: str, before: int = None):
+    """Load the latest page of conversation history, or the page before `before`, from the backend"""
     try:
-        response = requests.get(f"{API_URL}/conversations/{conversation_id}/history")
+        params = {"limit": HISTORY_PAGE_SIZE}
+        if before is not None:
+            params["before"] = before
+        response = requests.get(f"{API_URL}/conversations/{conversation_id}/history", params=params)
         if response.status_code == 200:
             data = response.json()
-            st.session_state.conversation_history = data["messages"]
+            if before is None:
+                st.session_state.conversation_history = data["messages"]
+            else:
+                st.session_state.conversation_history = data["messages"] + st.session_state.conversation_history
+            st.session_state.history_before = data["next_before"]
     except Exception as e:
         st.error(f"Failed to load conversation history: {str(e)}")
 
@@ -383,6 +411,61 @@ def load_conversation_files(conversation_id: str):
     except Exception as e:
         st.error(f"Failed to load conversation files: {str(e)}")
 
+def wait_for_ingestion_job(conversation_id: str, job_id: str) -> bool:
+    """Poll an upload job until it finishes, showing per-file progress"""
+    progress_bar = st.progress(0.0, text="Waiting for processing to start...")
+    file_status = st.empty()
+    while True:
+        response = requests.get(f"{API_URL}/conversations/{conversation_id}/jobs/{job_id}")
+        if response.status_code != 200:
+            st.error(f"Error checking processing status: {response.text}")
+            return False
+        job = response.json()
+
+        fraction = job["files_indexed"] / job["total_files"] if job["total_files"] else 1.0
+        progress_bar.progress(
+            fraction,
+            text=f"Indexed {job['files_indexed']}/{job['total_files']} files ({job['pages_per_second']} pages/s)"
+        )
+        file_status.markdown("\n".join(
+            f"- {file['filename']}: {file['stage']} ({file['pages']} pages, {file['chunks']} chunks)"
+            for file in job["files"]
+        ))
+
+        if job["status"] == "completed":
+            return True
+        if job["status"] == "failed":
+            st.error(f"Error processing documents: {job['error']}")
+            return False
+        time.sleep(1)
+
+def stream_chat_answer(conversation_id: str, payload: dict, status):
+    """Yield answer tokens from the streaming chat endpoint, logging tool calls in the status box"""
+    with requests.post(
+        f"{API_URL}/conversations/{conversation_id}/chat/stream",
+        json=payload,
+        stream=True
+    ) as response:
+        response.raise_for_status()
+        event = None
+        streamed = False
+        for line in response.iter_lines():
+            line = line.decode("utf-8")
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):])
+                if event == "tool_start":
+                    status.write(f"🔍 {data['tool']}: {data['input']}")
+                elif event == "token":
+                    streamed = True
+                    yield data["text"]
+                elif event == "done" and not streamed:
+                    # The answer couldn't be streamed token by token, so show it whole
+                    yield data["answer"]
+                elif event == "error":
+                    raise RuntimeError(data["detail"])
+
 def format_file_size(size_in_bytes: int) -> str:
     """Format file size to human readable format"""
     for unit in ['B', 'KB', 'MB', 'GB']:
@@ -404,6 +487,7 @@ def switch_conversation(conversation_id: str):
     """Switch to a different conversation"""
     st.session_state.current_conversation_id = conversation_id
     st.session_state.conversation_history = []
+    st.session_state.history_before = None
     st.session_state.conversation_files = []  # Clear existing files
     
     # Show loading message
@@ -465,6 +549,11 @@ with st.sidebar:
             switch_conversation(conv_id)
             st.rerun()
 
+    if st.session_state.has_more_conversations:
+        if st.button("Show more", key="more_convs"):
+            st.session_state.conversations_limit += CONVERSATIONS_PAGE_SIZE
+            st.rerun()
+
     st.divider()
     
     # Assistant settings
@@ -530,19 +619,21 @@ with st.sidebar:
     
     if uploaded_files:
         if st.button("Process Documents"):
-            with st.spinner("Processing documents..."):
-                files = [("files", file) for file in uploaded_files]
-                try:
+            files = [("files", file) for file in uploaded_files]
+            try:
+                with st.spinner("Uploading documents..."):
                     response = requests.post(
                         f"{API_URL}/conversations/{st.session_state.current_conversation_id}/upload",
                         files=files
                     )
-                    if response.status_code == 200:
+                if response.status_code == 200:
+                    if wait_for_ingestion_job(st.session_state.current_conversation_id, response.json()["job_id"]):
                         st.success("Documents processed successfully!")
-                    else:
-                        st.error(f"Error processing documents: {response.text}")
-                except Exception as e:
-                    st.error(f"Error uploading documents: {str(e)}")
+                        load_conversation_files(st.session_state.current_conversation_id)
+                else:
+                    st.error(f"Error processing documents: {response.text}")
+            except Exception as e:
+                st.error(f"Error uploading documents: {str(e)}")
 
 # Main chat interface
 st.title("📚 PDF Document Chatbot")
@@ -551,6 +642,12 @@ st.title("📚 PDF Document Chatbot")
 if not st.session_state.current_conversation_id:
     create_new_conversation()
 
+# Older history is fetched a page at a time
+if st.session_state.history_before is not None:
+    if st.button("Load earlier messages"):
+        load_conversation_history(st.session_state.current_conversation_id, st.session_state.history_before)
+        st.rerun()
+
 # Display conversation history
 for message in st.session_state.conversation_history:
     with st.chat_message(message["role"]):
@@ -563,24 +660,22 @@ if prompt := st.chat_input("Ask a question about your documents"):
     with st.chat_message("user"):
         st.write(prompt)
 
-    # Get AI response
+    # Get AI response, streamed as it is generated
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            try:
-                response = requests.post(
-                    f"{API_URL}/conversations/{st.session_state.current_conversation_id}/chat",
-                    json={
-                        "question": prompt,
-                        "assistant_name": st.session_state.assistant_name,
-                        "assistant_behavior": st.session_state.assistant_behavior,
-                        "custom_instructions": st.session_state.custom_instructions
-                    }
-                )
-                if response.status_code == 200:
-                    answer = response.json()["answer"]
-                    st.write(answer)
-                    st.session_state.conversation_history.append({"role": "assistant", "content": answer})
-                else:
-                    st.error(f"Error: {response.text}")
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
\ No newline at end of file
+        status = st.status("Thinking...", expanded=False)
+        try:
+            answer = st.write_stream(stream_chat_answer(
+                st.session_state.current_conversation_id,
+                {
+                    "question": prompt,
+                    "assistant_name": st.session_state.assistant_name,
+                    "assistant_behavior": st.session_state.assistant_behavior,
+                    "custom_instructions": st.session_state.custom_instructions
+                },
+                status
+            ))
+            status.update(label="Done", state="complete")
+            st.session_state.conversation_history.append({"role": "assistant", "content": answer})
+        except Exception as e:
+            status.update(label="Failed", state="error")
+            st.error(f"Error: {str(e)}")
\ No newline at end of file